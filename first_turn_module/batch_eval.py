@@ -0,0 +1,287 @@
+"""Offline batch evaluation of candidate opener prompts.
+
+Sends every combination of candidate opener prompts and test cases
+through `_get_opener_response` with bounded concurrency, retrying failed
+requests, and appends the results to a JSON Lines log with the
+`Opener_prompt`, `text` and `response` keys read by
+`first_turn_analysis/log2html_converter.py`.
+
+The log doubles as the checkpoint: when the run is interrupted and
+started again with the same output file, the combinations already in the
+log are skipped. Pass `--mock` to run against a local `FakeModelServer`
+instead of the model.
+
+Example:
+    python -m first_turn_module.batch_eval --prompts a.txt b.txt \\
+        --cases cases.txt --output ab_test.log --concurrency 32
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.utils import my_debug_logger
+
+from . import first_turn
+from .fake_model_server import FakeModelServer
+
+
+class TestCase:
+    """One test case: the user's message and optional topical knowledge."""
+
+    def __init__(self, text, external_knowledge=None):
+        self.text = text
+        self.external_knowledge = external_knowledge
+
+    def history(self):
+        """
+        Return the conversation history the opener is generated for.
+
+        Returns:
+            list: A single turn with the user's message awaiting the bot.
+        """
+        return [{"user": self.text, "bot": None}]
+
+
+def load_prompts(paths):
+    """
+    Load candidate opener prompts, one per file.
+
+    Args:
+        paths (list): Paths of text files each holding one prompt.
+
+    Returns:
+        list: The prompts, without duplicates, in the given order.
+    """
+    prompts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as prompt_file:
+            prompt = prompt_file.read().strip()
+        if prompt not in prompts:
+            prompts.append(prompt)
+    return prompts
+
+
+def load_cases(path):
+    """
+    Load the test case corpus.
+
+    A `.jsonl` file holds one object per line with a `text` key and an
+    optional `external_knowledge` key; any other file holds one test case
+    text per line. Blank lines are ignored.
+
+    Args:
+        path (str): Path of the corpus.
+
+    Returns:
+        list: The TestCase objects, without duplicate texts.
+    """
+    cases = {}
+    with open(path, encoding="utf-8") as cases_file:
+        for line in cases_file:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                case = TestCase(record["text"],
+                                record.get("external_knowledge"))
+            else:
+                case = TestCase(line)
+            cases.setdefault(case.text, case)
+    return list(cases.values())
+
+
+def load_checkpoint(output_file):
+    """
+    Read the combinations already evaluated from an earlier run's log.
+
+    A last line cut off by an interrupted run is removed from the log.
+
+    Args:
+        output_file (str): Path of the JSON Lines log.
+
+    Returns:
+        set: The (opener prompt, test case text) pairs in the log.
+    """
+    done = set()
+    if not os.path.exists(output_file):
+        return done
+    complete_bytes = 0
+    with open(output_file, "rb") as log_file:
+        for line in log_file:
+            if not line.endswith(b"\n"):
+                break
+            complete_bytes += len(line)
+            if line.strip():
+                entry = json.loads(line)
+                done.add((entry["Opener_prompt"], entry["text"]))
+    if complete_bytes < os.path.getsize(output_file):
+        with open(output_file, "r+b") as log_file:
+            log_file.truncate(complete_bytes)
+    return done
+
+
+def request_with_retries(prompt, case, retries, backoff, request_options):
+    """
+    Request one opener, retrying failed requests with jittered backoff.
+
+    Args:
+        prompt (str): The opener prompt.
+        case (TestCase): The test case.
+        retries (int): Number of retries after the first attempt.
+        backoff (float): Seconds to wait before the first retry, doubled
+                         for every further retry.
+        request_options (dict): Keyword arguments for
+                                `_get_opener_response`.
+
+    Returns:
+        tuple: The response and the number of attempts made.
+    """
+    for attempt in range(retries + 1):
+        try:
+            result = first_turn._get_opener_response(
+                case.history(), external_knowledge=case.external_knowledge,
+                opener_prompt=prompt, use_backup=False, **request_options)
+            return result["dialogue_response"], attempt + 1
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def run_evaluation(prompts, cases, output_file, concurrency=16, retries=3,
+                   backoff=0.5, progress_interval=10.0, **request_options):
+    """
+    Evaluate every prompt on every test case and append the results.
+
+    Args:
+        prompts (list): The candidate opener prompts.
+        cases (list): The TestCase objects.
+        output_file (str): Path of the JSON Lines log, which is resumed
+                           if it exists.
+        concurrency (int): Maximum number of requests in flight.
+        retries (int): Retries per combination before giving up on it.
+        backoff (float): Seconds before the first retry.
+        progress_interval (float): Seconds between progress lines, or None.
+        **request_options: Keyword arguments for `_get_opener_response`,
+                           such as controller_address or max_new_tokens.
+
+    Returns:
+        dict: Counts of completed, skipped and failed combinations,
+              retries, the elapsed time and the throughput.
+    """
+    done = load_checkpoint(output_file)
+    pending = ((prompt, case) for prompt in prompts for case in cases
+               if (prompt, case.text) not in done)
+    skipped = sum((prompt, case.text) in done
+                  for prompt in prompts for case in cases)
+    stats = {"total": len(prompts) * len(cases), "skipped": skipped,
+             "completed": 0, "failed": 0, "retries": 0}
+    lock = threading.Lock()
+
+    def evaluate(prompt, case):
+        response, attempts = request_with_retries(
+            prompt, case, retries, backoff, request_options)
+        line = json.dumps({"Opener_prompt": prompt, "text": case.text,
+                           "response": response}) + "\n"
+        with lock:
+            log_file.write(line)
+            log_file.flush()
+            stats["retries"] += attempts - 1
+
+    start = last_progress = time.perf_counter()
+    with open(output_file, "a", encoding="utf-8") as log_file, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        while True:
+            # Submit lazily, keeping the workers busy without queueing the
+            # whole cross product
+            while len(in_flight) < 2 * concurrency:
+                combination = next(pending, None)
+                if combination is None:
+                    break
+                in_flight.add(pool.submit(evaluate, *combination))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.exception() is None:
+                    stats["completed"] += 1
+                else:
+                    stats["failed"] += 1
+                    my_debug_logger.error(
+                        f"Batch evaluation request failed: "
+                        f"{future.exception()}")
+            now = time.perf_counter()
+            if progress_interval and now - last_progress >= progress_interval:
+                last_progress = now
+                print(_progress_line(stats, now - start), file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["pairs_per_second"] = stats["completed"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def _progress_line(stats, elapsed):
+    """Format the progress of a running evaluation."""
+    finished = stats["skipped"] + stats["completed"] + stats["failed"]
+    rate = stats["completed"] / elapsed if elapsed else 0.0
+    return (f"{finished}/{stats['total']} combinations, "
+            f"{stats['failed']} failed, {rate:.1f} prompts x cases/s")
+
+
+def main():
+    """Run a batch evaluation from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", nargs="+", required=True,
+                        help="text files holding one opener prompt each")
+    parser.add_argument("--cases", required=True,
+                        help="test cases, one per line, or a .jsonl file")
+    parser.add_argument("--output", required=True,
+                        help="JSON Lines log to write or resume")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.5)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--controller-address", default=None)
+    parser.add_argument("--model-name", default=None)
+    parser.add_argument("--mock", action="store_true",
+                        help="evaluate against a local fake model server")
+    parser.add_argument("--mock-latency", type=float, default=0.2)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts)
+    cases = load_cases(args.cases)
+    request_options = {"max_new_tokens": args.max_new_tokens}
+    if args.model_name:
+        request_options["model_name"] = args.model_name
+
+    def run(controller_address):
+        if controller_address:
+            request_options["controller_address"] = controller_address
+        return run_evaluation(prompts, cases, args.output,
+                              concurrency=args.concurrency,
+                              retries=args.retries, backoff=args.backoff,
+                              **request_options)
+
+    if args.mock:
+        with FakeModelServer(latency=args.mock_latency,
+                             error_rate=args.mock_error_rate,
+                             model_name=args.model_name or "vicuna") as server:
+            request_options["model_name"] = server.model_name
+            stats = run(server.address)
+    else:
+        stats = run(args.controller_address)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Load test and latency benchmark for the conversation opener path.
+
+Starts a `FakeModelServer` with a configurable latency distribution and
+error rate, then drives many concurrent synthetic sessions with varying
+history lengths and topical knowledge sizes through the opener pipeline,
+either through the blocking `_get_opener_response` on a thread pool or
+through the asyncio path. It reports throughput, latency
+percentiles, the fallback rate and the time spent in each pipeline stage,
+and can save the results as JSON and compare them with an earlier run.
+
+Example:
+    python -m first_turn_module.bench_openers --sessions 500 \\
+        --concurrency 32 --distribution lognormal --output run.json
+    python -m first_turn_module.bench_openers --compare run.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import first_turn
+from .fake_model_server import FAKE_OPENERS, LATENCY_DISTRIBUTIONS
+from .fake_model_server import FakeModelServer
+
+
+class SyntheticSession:
+    """A stand-in for a StateManager, identifying one benchmark session."""
+
+    def __init__(self, history, topical_knowledge):
+        self.history = history
+        self.topical_knowledge = topical_knowledge
+
+
+def make_sessions(count, history_lengths, knowledge_sizes, seed=0):
+    """
+    Create synthetic sessions with varying history and knowledge sizes.
+
+    Args:
+        count (int): Number of sessions.
+        history_lengths (list): History lengths (in turns) to draw from.
+        knowledge_sizes (list): Knowledge sizes (in words) to draw from.
+        seed (int): Seed for the random content.
+
+    Returns:
+        list: The SyntheticSession objects.
+    """
+    rng = random.Random(seed)
+    vocabulary = " ".join(FAKE_OPENERS).split()
+    sessions = []
+    for _ in range(count):
+        history = [{"user": " ".join(rng.choices(vocabulary, k=12)),
+                    "bot": " ".join(rng.choices(vocabulary, k=20))}
+                   for _ in range(rng.choice(history_lengths))]
+        history.append({"user": "", "bot": None})
+        size = rng.choice(knowledge_sizes)
+        knowledge = (" ".join(rng.choices(vocabulary, k=size)) + "."
+                     if size else None)
+        sessions.append(SyntheticSession(history, knowledge))
+    return sessions
+
+
+def percentile(values, q):
+    """
+    Return the q-th percentile of a list of values.
+
+    Args:
+        values (list): The measured values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The nearest-rank percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1,
+                      round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+class StageRecorder:
+    """Stage observer collecting the duration of every pipeline stage."""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, seconds):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    def summary(self):
+        """
+        Summarize the recorded stage durations.
+
+        Returns:
+            dict: Count, mean, p50 and p99 in milliseconds per stage.
+        """
+        return {stage: {"count": len(values),
+                        "mean_ms": sum(values) / len(values) * 1000,
+                        "p50_ms": percentile(values, 50) * 1000,
+                        "p99_ms": percentile(values, 99) * 1000}
+                for stage, values in sorted(self.durations.items())}
+
+
+def run_sync(sessions, concurrency, controller_address):
+    """Request openers through the blocking path on a thread pool."""
+    def one_session(session):
+        start = time.perf_counter()
+        first_turn._get_opener_response(
+            session.history, controller_address=controller_address,
+            external_knowledge=session.topical_knowledge,
+            state_manager=session)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one_session, sessions))
+
+
+async def run_async(sessions, concurrency, controller_address):
+    """Request openers through the asyncio path."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_session(session):
+        async with semaphore:
+            start = time.perf_counter()
+            await first_turn._aget_opener_response(
+                session.history, controller_address=controller_address,
+                external_knowledge=session.topical_knowledge,
+                state_manager=session)
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(one_session(session)
+                                  for session in sessions))
+
+
+def run_benchmark(args):
+    """
+    Run one benchmark with the parsed command line options.
+
+    Args:
+        args (Namespace): The parsed command line options.
+
+    Returns:
+        dict: The configuration and results of the run.
+    """
+    sessions = make_sessions(args.sessions, args.history_lengths,
+                             args.knowledge_sizes, args.seed)
+    recorder = StageRecorder()
+    first_turn.add_stage_observer(recorder)
+    paths_before = first_turn.get_opener_path_stats()
+    try:
+        with FakeModelServer(latency=args.latency,
+                             error_rate=args.error_rate, seed=args.seed,
+                             distribution=args.distribution,
+                             spread=args.spread) as server:
+            start = time.perf_counter()
+            if args.mode == "async":
+                latencies = asyncio.run(run_async(
+                    sessions, args.concurrency, server.address))
+            else:
+                latencies = run_sync(sessions, args.concurrency,
+                                     server.address)
+            elapsed = time.perf_counter() - start
+    finally:
+        first_turn.remove_stage_observer(recorder)
+
+    paths = first_turn.get_opener_path_stats()
+    paths = {path: count - paths_before.get(path, 0)
+             for path, count in paths.items()}
+    fallbacks = sum(count for path, count in paths.items()
+                    if path.endswith("_fallback"))
+    return {
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("output", "compare")},
+        "results": {
+            "throughput": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "fallback_rate": fallbacks / len(latencies),
+            "paths": paths,
+            "stages": recorder.summary(),
+        },
+    }
+
+
+def compare(current, previous):
+    """
+    Print the change of each headline metric against an earlier run.
+
+    Args:
+        current (dict): Results of this run.
+        previous (dict): Results loaded from an earlier run's JSON.
+    """
+    for key in ("throughput", "p50_ms", "p95_ms", "p99_ms", "fallback_rate"):
+        now = current["results"][key]
+        before = previous["results"][key]
+        change = (now - before) / before * 100 if before else 0.0
+        print(f"{key:>14}: {before:10.2f} -> {now:10.2f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--history-lengths", type=int, nargs="+",
+                        default=[0, 2, 8, 32],
+                        help="history lengths in turns to draw from")
+    parser.add_argument("--knowledge-sizes", type=int, nargs="+",
+                        default=[0, 100, 1000],
+                        help="topical knowledge sizes in words to draw from")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="typical fake model latency in seconds")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS,
+                        default="lognormal")
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print(json.dumps(result["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as output_f:
+            json.dump(result, output_f, indent=2)
+    if args.compare:
+        with open(args.compare) as previous_f:
+            compare(result, json.load(previous_f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Cold-start benchmark for the first turn module.
+
+Imports the module in fresh interpreters with `python -X importtime` and
+reports the median import time, the slowest modules it pulls in and,
+optionally, the time `first_turn.warmup` takes afterwards. The results
+can be saved as JSON and compared with an earlier run, and `--max-ms`
+makes the run fail when the import got slower than a budget, so cold
+starts can be kept in check in CI.
+
+Example:
+    python -m first_turn_module.bench_startup --runs 10 --output base.json
+    python -m first_turn_module.bench_startup --compare base.json \\
+        --max-ms 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULE = "first_turn_module.first_turn"
+
+# Imports the module, then times a warmup without the model connection.
+WARMUP_SCRIPT = """
+import json, time
+import {module} as module
+start = time.perf_counter()
+timings = module.warmup(connect=False)
+timings["total"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parse the report of `python -X importtime`.
+
+    Args:
+        stderr (str): The standard error of the interpreter.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth)
+              tuples in the order reported, i.e. every module after the
+              modules it imported.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped) - 1) // 2
+        imports.append((stripped, int(fields[0]), int(fields[1]), depth))
+    return imports
+
+
+def import_subtree(imports, module):
+    """
+    Select the imports caused by importing a module.
+
+    Args:
+        imports (list): Parsed imports, see `parse_importtime`.
+        module (str): The name of the imported module.
+
+    Returns:
+        list: The module's own entry last, preceded by everything it
+              imported, or an empty list if the module was not imported.
+    """
+    for end, (name, _, _, depth) in enumerate(imports):
+        if name == module:
+            start = end
+            while start > 0 and imports[start - 1][3] > depth:
+                start -= 1
+            return imports[start:end + 1]
+    return []
+
+
+def measure_import(module, env):
+    """
+    Import a module in a fresh interpreter.
+
+    Args:
+        module (str): The module to import.
+        env (dict): The environment of the interpreter.
+
+    Returns:
+        list: The imports caused by the module, see `import_subtree`.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True)
+    return import_subtree(parse_importtime(result.stderr), module)
+
+
+def measure_warmup(module, env):
+    """
+    Import a module and time its warmup in a fresh interpreter.
+
+    Args:
+        module (str): The module to import.
+        env (dict): The environment of the interpreter.
+
+    Returns:
+        dict: The timings returned by `warmup`, plus its total time.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", WARMUP_SCRIPT.format(module=module)],
+        capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def run_benchmark(args):
+    """
+    Run the cold-start benchmark.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        dict: The configuration and the results of the run.
+    """
+    env = dict(os.environ)
+    # Compile once, so that the measured runs read the cached bytecode
+    measure_import(args.module, env)
+    runs = [measure_import(args.module, env) for _ in range(args.runs)]
+    totals = [subtree[-1][2] / 1000 for subtree in runs if subtree]
+    if not totals:
+        raise RuntimeError(f"{args.module} was not imported")
+
+    # Per-module self times, as the median over the runs
+    self_times = {}
+    for subtree in runs:
+        for name, self_us, _, _ in subtree:
+            self_times.setdefault(name, []).append(self_us / 1000)
+    slowest = sorted(((statistics.median(times), name)
+                      for name, times in self_times.items()), reverse=True)
+
+    results = {
+        "import_ms": {
+            "median": statistics.median(totals),
+            "min": min(totals),
+            "max": max(totals),
+        },
+        "modules": len(runs[-1]),
+        "slowest_modules": [{"module": name, "self_ms": ms}
+                            for ms, name in slowest[:args.top]],
+    }
+    if args.warmup:
+        warmups = [measure_warmup(args.module, env) for _ in range(args.runs)]
+        results["warmup_ms"] = {
+            step: statistics.median(timings[step] for timings in warmups) * 1000
+            for step in ("imports", "prompt", "total")}
+    return {"config": {"module": args.module, "runs": args.runs,
+                       "python": sys.version.split()[0]},
+            "results": results}
+
+
+def compare(current, previous):
+    """Print the change in import and warmup time against an earlier run."""
+    for key in ("import_ms", "warmup_ms"):
+        now = current["results"].get(key)
+        before = previous["results"].get(key)
+        if not now or not before:
+            continue
+        field = "median" if key == "import_ms" else "total"
+        change = (now[field] - before[field]) / before[field] * 100 \
+            if before[field] else 0.0
+        print(f"{key} {field}: {before[field]:.1f} -> {now[field]:.1f} "
+              f"({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=MODULE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15,
+                        help="number of slowest modules to report")
+    parser.add_argument("--warmup", action="store_true",
+                        help="also time warmup() without the model connection")
+    parser.add_argument("--max-ms", type=float,
+                        help="fail if the median import takes longer")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print(json.dumps(result["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as output_f:
+            json.dump(result, output_f, indent=2)
+    if args.compare:
+        with open(args.compare) as previous_f:
+            compare(result, json.load(previous_f))
+    median = result["results"]["import_ms"]["median"]
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"Import took {median:.1f} ms, over the budget of "
+              f"{args.max_ms:.1f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
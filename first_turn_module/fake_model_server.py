@@ -0,0 +1,253 @@
+"""Local stand-in for the Vicuna controller and model worker.
+
+This module serves the small subset of the FastChat controller and model
+worker HTTP API that the first turn module relies on, so that the opener
+path can be exercised and benchmarked without a GPU. A single server acts
+as both the controller and its only worker: it resolves every model name
+to its own address and streams canned openers back with a configurable
+latency and error rate.
+
+Example:
+    python -m first_turn_module.fake_model_server --port 21001 --latency 0.3
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FAKE_OPENERS = [
+    "I'm curious, if you could live in any fictional world, which one "
+    "would you pick?",
+    "I'm curious, if you could master any skill overnight, what would "
+    "it be?",
+    "I'm curious, if you could visit any planet, where would you go first?",
+    "I'm curious, if you could swap lives with anyone for a day, who "
+    "would it be?",
+]
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class FakeModelServer:
+    """
+    A threaded HTTP server emulating a FastChat controller and worker.
+
+    The time spent on a full response is drawn per request: "fixed" always
+    takes `latency` seconds, "uniform" draws from `latency * (1 +/- spread)`
+    and "lognormal" has median `latency` and shape `spread`, which gives the
+    long tail typical of a loaded model worker.
+
+    Args:
+        host (str): The interface to bind to.
+        port (int): The port to bind to, 0 picks a free port.
+        model_name (str): The model name reported by the fake worker.
+        latency (float): Typical seconds spent generating a full response.
+        error_rate (float): Probability that a generation request fails.
+        seed (int, optional): Seed for the latency and error randomness.
+        distribution (str): One of `LATENCY_DISTRIBUTIONS`.
+        spread (float): Width of the latency distribution.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, model_name="vicuna",
+                 latency=0.2, error_rate=0.0, seed=None,
+                 distribution="fixed", spread=0.5):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.model_name = model_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.distribution = distribution
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._httpd = _FakeHTTPServer((host, port), _FakeModelHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake_server = self
+        self._thread = None
+
+    @property
+    def address(self):
+        """str: Base URL of the server, usable as controller or worker."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving requests on a background thread."""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="fake-model-server",
+            daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests and close the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def sample_latency(self):
+        """
+        Draw the time a response takes from the latency distribution.
+
+        Returns:
+            float: The latency in seconds.
+        """
+        if self.distribution == "uniform":
+            return max(0.0, self.random.uniform(
+                self.latency * (1 - self.spread),
+                self.latency * (1 + self.spread)))
+        if self.distribution == "lognormal":
+            return self.random.lognormvariate(math.log(self.latency),
+                                              self.spread)
+        return self.latency
+
+    def generate(self, params):
+        """
+        Produce the sequence of streamed outputs for a generation request.
+
+        Args:
+            params (dict): The JSON body of a `worker_generate_stream` call.
+
+        Returns:
+            tuple: The delay between chunks in seconds and the list of
+                   (cumulative output text, tokens generated, finish reason)
+                   tuples, or None when the request should fail.
+        """
+        with self._lock:
+            self.requests_served += 1
+            if self.random.random() < self.error_rate:
+                return None
+            opener = self.random.choice(FAKE_OPENERS)
+            latency = self.sample_latency()
+        max_new_tokens = int(params.get("max_new_tokens", 64))
+        words = (opener + "###Human: ...").split(" ")[:max_new_tokens]
+        prompt = params.get("prompt", "")
+        stop = params.get("stop") or []
+        # Like FastChat, accept a single stop string or a list of them
+        stops = [stop] if isinstance(stop, str) else stop
+        outputs = []
+        for i in range(1, len(words) + 1):
+            text = " ".join(words[:i])
+            cut = min((text.index(stop) for stop in stops if stop in text),
+                      default=None)
+            if cut is not None:
+                outputs.append((prompt + " " + text[:cut], i, "stop"))
+                break
+            outputs.append((prompt + " " + text, i, None))
+        if outputs and outputs[-1][2] is None:
+            # The canned text ran out or the token budget was used up
+            finish_reason = ("length" if len(words) == max_new_tokens
+                             else "stop")
+            outputs[-1] = outputs[-1][:2] + (finish_reason,)
+        return latency / max(len(outputs), 1), outputs
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    """Threaded server accepting the connection bursts of load tests."""
+
+    request_queue_size = 1024
+
+
+class _FakeModelHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the FastChat endpoints used here."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        params = json.loads(body) if body else {}
+        server = self.server.fake_server
+
+        if self.path == "/refresh_all_workers":
+            self._send_json({})
+        elif self.path == "/list_models":
+            self._send_json({"models": [server.model_name]})
+        elif self.path == "/get_worker_address":
+            address = (server.address
+                       if params.get("model") == server.model_name else "")
+            self._send_json({"address": address})
+        elif self.path == "/worker_get_status":
+            self._send_json({"model_names": [server.model_name],
+                             "speed": 1, "queue_length": 0})
+        elif self.path == "/worker_generate_stream":
+            self._stream_generation(server.generate(params))
+        else:
+            self.send_error(404)
+
+    def _send_json(self, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_generation(self, generation):
+        if generation is None:
+            chunks = [{"text": "**NETWORK ERROR DUE TO HIGH TRAFFIC.**",
+                       "error_code": 1}]
+            delay = 0.0
+        else:
+            delay, outputs = generation
+            chunks = [{"text": text, "error_code": 0,
+                       "finish_reason": finish_reason,
+                       "usage": {"completion_tokens": tokens}}
+                      for text, tokens, finish_reason in outputs]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                time.sleep(delay)
+                data = json.dumps(chunk).encode() + b"\0"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. after an early stop.
+            self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=21001)
+    parser.add_argument("--model-name", default="vicuna")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS,
+                        default="fixed")
+    parser.add_argument("--spread", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server = FakeModelServer(args.host, args.port, args.model_name,
+                             args.latency, args.error_rate,
+                             distribution=args.distribution,
+                             spread=args.spread)
+    print(f"Fake model server listening on {server.address}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,154 @@ This module is designed to generate conversation openers for the
 GauchoChat AI system. Its primary function is to provide an interface
 for other modules to initiate conversations with varied and imaginative
 starting points.
+
+Importing the module is cheap: FastChat, the GauchoChat utilities, the
+HTTP client and asyncio are imported on first use, and the configuration
+is read when first needed. Call `warmup` at startup to pay those costs,
+and open the model connection, before the first opener is requested.
 """
 
+import contextlib
+import functools
 import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .opener_budget import AdaptiveTokenBudget
+from .opener_deadline import DeadlineExceeded, PathCounters
+from .opener_deadline import acall_with_deadline, call_with_deadline
+from .opener_knowledge import pack_knowledge, packing_stats
+from .opener_logging import PromptLogWriter
+from .opener_metrics import OpenerMetrics
+from .opener_pool import OpenerPool
+from .opener_prompt_builder import IncrementalPromptBuilder
+from .opener_prompt_cache import PromptPrefixCache
+from .opener_response_cache import CachedResponse, ResponseCache
+from .opener_tokenizer import count_tokens, measure_tokens
+from .opener_tokenizer import set_tokenizer_path
+
+
+# Dispatcher shared by every asynchronous opener request of this process.
+_opener_dispatcher = None
+
+# Rendered system prompt (plus external knowledge) prefixes.
+_prompt_prefix_cache = PromptPrefixCache()
+
+# Incremental prompt builders, by state manager (i.e. session).
+_prompt_builders = weakref.WeakKeyDictionary()
+_prompt_builders_lock = threading.Lock()
+
+# Pre-generated openers for empty histories, see `enable_opener_pool`.
+_opener_pool = None
+
+# Threads running model requests under a latency budget.
+_deadline_executor = None
+
+# How often each opener path (model, hedge, pool, fallback, ...) is taken.
+_opener_paths = PathCounters()
+
+# Long-lived, connection-pooled model clients, by controller address.
+_vicuna_clients = {}
+
+# Marks the end of an opener in the model output.
+_OPENER_DELIMITER = "###"
+
+# Called as `observer(stage, seconds)` after each pipeline stage.
+_stage_observers = ()
+_NO_TIMING = contextlib.nullcontext()
+
+# Pipeline metrics, see `enable_metrics`.
+_metrics = None
+
+# Sampled JSON Lines log of prompts and openers, see `enable_prompt_log`.
+_prompt_log = None
+
+# On-disk cache of model outputs, see `enable_response_cache`.
+_response_cache = None
+
+# Sampling temperature of opener generations.
+_OPENER_TEMPERATURE = 0.7
+
+# Learned max_new_tokens, see `enable_adaptive_generation`.
+_token_budget = None
+
+# Stop sequences sent to the worker besides the next user turn.
+_extra_stops = ()
+
+
+@functools.lru_cache(maxsize=None)
+def _config():
+    """
+    Import the GauchoChat configuration on first use.
+
+    Token counts use the model's tokenizer when one is configured.
+
+    Returns:
+        type: The `GlobalConfig` class.
+    """
+    from utils.config import GlobalConfig
+    set_tokenizer_path(getattr(GlobalConfig, "opener_tokenizer_path", None))
+    return GlobalConfig
+
+
+def _logger():
+    """Return the GauchoChat debug logger, importing it on first use."""
+    from utils.utils import my_debug_logger
+    return my_debug_logger
+
+
+def _resolve_model(controller_address, model_name):
+    """
+    Fill in the configured controller and model where none was given.
+
+    Args:
+        controller_address (str, optional): The address of the controller.
+        model_name (str, optional): The name of the model.
 
-from fastchat.conversation import Conversation, SeparatorStyle
+    Returns:
+        tuple: The controller address and the model name.
+    """
+    config = _config()
+    if controller_address is None:
+        controller_address = config.controller_address
+    if model_name is None:
+        model_name = config.model_name
+    return controller_address, model_name
+
+
+def _deadline_settings(latency_budget, hedge_worker_address, hedge_delay):
+    """
+    Fill in the configured latency budget and hedging where none was given.
+
+    The settings are read from `GlobalConfig.opener_latency_budget`,
+    `GlobalConfig.opener_hedge_worker_address` and
+    `GlobalConfig.opener_hedge_delay`, each optional.
+
+    Args:
+        latency_budget (float, optional): Seconds to wait for the model.
+        hedge_worker_address (str, optional): The address of the hedge
+                                              worker.
+        hedge_delay (float, optional): Seconds to wait before hedging.
 
-from utils.config import GlobalConfig as GC
-from utils.state_manager import get_history_from_state_manager
-from utils.utils import my_debug_logger
-from utils.vicuna import filter_main_dialogue_output
-from utils.vicuna import make_request_to_vicuna_model
+    Returns:
+        tuple: The latency budget, hedge worker address and hedge delay.
+    """
+    config = _config()
+    if latency_budget is None:
+        latency_budget = getattr(config, "opener_latency_budget", None)
+    if hedge_worker_address is None:
+        hedge_worker_address = getattr(config, "opener_hedge_worker_address",
+                                       None)
+    if hedge_delay is None:
+        hedge_delay = getattr(config, "opener_hedge_delay", None)
+    return latency_budget, hedge_worker_address, hedge_delay
 
 
-def generate_conversation_opener_generic(state_manager):
+def generate_conversation_opener_generic(state_manager, latency_budget=None,
+                                         hedge_worker_address=None,
+                                         hedge_delay=None):
     """
     Generate a generic conversation opener based on the state manager history.
 
@@ -30,6 +164,15 @@ def generate_conversation_opener_generic(state_manager):
         state_manager (StateManager): An instance of StateManager that contains
                                       the current state and history of the
                                       conversation.
+        latency_budget (float, optional): Seconds to wait for the model
+            before answering from the pool or the fallback openers, by
+            default `GlobalConfig.opener_latency_budget`. Without a budget
+            the model is waited for.
+        hedge_worker_address (str, optional): A second worker that receives
+            a duplicate request when the first one is slow, by default
+            `GlobalConfig.opener_hedge_worker_address`.
+        hedge_delay (float, optional): Seconds to wait before hedging, by
+            default `GlobalConfig.opener_hedge_delay` or half of the budget.
 
     Returns:
         str: A conversation opener generated based on the current context.
@@ -38,15 +181,421 @@ def generate_conversation_opener_generic(state_manager):
         This function should be the only one called by external modules to
         generate conversation openers within this module.
     """
-    history = get_history_from_state_manager(state_manager)
+    from utils.state_manager import get_history_from_state_manager
+    with _timed_stage("history"):
+        history = get_history_from_state_manager(state_manager)
     external_knowledge = getattr(state_manager.user_attributes,
                                  "topical_knowledge", None)
+    latency_budget, hedge_worker_address, hedge_delay = _deadline_settings(
+        latency_budget, hedge_worker_address, hedge_delay)
     response = _get_opener_response(
-        history, False,  # continued_generation,
-        external_knowledge=external_knowledge, state_manager=state_manager)
+        history, continued_generation=False,
+        external_knowledge=external_knowledge, state_manager=state_manager,
+        latency_budget=latency_budget,
+        hedge_worker_address=hedge_worker_address, hedge_delay=hedge_delay)
+    return response["dialogue_response"]
+
+
+async def agenerate_conversation_opener(state_manager, latency_budget=None,
+                                        hedge_worker_address=None,
+                                        hedge_delay=None):
+    """
+    Asynchronously generate a generic conversation opener.
+
+    This is the asyncio counterpart of
+    `generate_conversation_opener_generic`. Instead of blocking a worker
+    thread on the model call, the request is sent by a shared dispatcher
+    and awaited on the event loop.
+
+    Args:
+        state_manager (StateManager): An instance of StateManager that contains
+                                      the current state and history of the
+                                      conversation.
+        latency_budget (float, optional): The latency budget, see
+            `generate_conversation_opener_generic`.
+        hedge_worker_address (str, optional): The hedge worker, see
+            `generate_conversation_opener_generic`.
+        hedge_delay (float, optional): The hedge delay, see
+            `generate_conversation_opener_generic`.
+
+    Returns:
+        str: A conversation opener generated based on the current context.
+    """
+    from utils.state_manager import get_history_from_state_manager
+    with _timed_stage("history"):
+        history = get_history_from_state_manager(state_manager)
+    external_knowledge = getattr(state_manager.user_attributes,
+                                 "topical_knowledge", None)
+    latency_budget, hedge_worker_address, hedge_delay = _deadline_settings(
+        latency_budget, hedge_worker_address, hedge_delay)
+    response = await _aget_opener_response(
+        history, continued_generation=False,
+        external_knowledge=external_knowledge, state_manager=state_manager,
+        latency_budget=latency_budget,
+        hedge_worker_address=hedge_worker_address, hedge_delay=hedge_delay)
     return response["dialogue_response"]
 
 
+def stream_conversation_opener(state_manager):
+    """
+    Stream a generic conversation opener as it is being generated.
+
+    This works like `generate_conversation_opener_generic`, but yields the
+    opener while the model produces it so the UI can start rendering the
+    first sentence early. Generation is cancelled as soon as the opener is
+    complete.
+
+    Args:
+        state_manager (StateManager): An instance of StateManager that contains
+                                      the current state and history of the
+                                      conversation.
+
+    Yields:
+        str: The opener so far. Each value replaces the previous one; the
+             last value is the complete opener.
+    """
+    from utils.state_manager import get_history_from_state_manager
+    with _timed_stage("history"):
+        history = get_history_from_state_manager(state_manager)
+    external_knowledge = getattr(state_manager.user_attributes,
+                                 "topical_knowledge", None)
+    yield from _stream_opener_response(
+        history, continued_generation=False,
+        external_knowledge=external_knowledge, state_manager=state_manager)
+
+
+def warmup(controller_address=None, model_name=None, opener_prompt=None,
+           connect=True):
+    """
+    Prepare the module for serving openers, e.g. at worker startup.
+
+    Imports the deferred dependencies, reads the configuration, renders
+    the static system prompt prefix into the prompt-prefix cache, loads the
+    tokenizer if one is configured and, with `connect`, resolves the
+    model's workers through the controller and opens keep-alive
+    connections to them. A failed connection is logged rather than raised,
+    so a worker can start before the model is up.
+
+    Args:
+        controller_address (str, optional): The address of the controller,
+                                            by default
+                                            `GlobalConfig.controller_address`.
+        model_name (str, optional): The name of the model, by default
+                                    `GlobalConfig.model_name`.
+        opener_prompt (str, optional): The system prompt, by default
+                                       `GlobalConfig.opener_prompt`.
+        connect (bool): Whether to open the model connection.
+
+    Returns:
+        dict: Seconds spent on each step (imports, prompt, connect) and the
+              number of workers connected to.
+    """
+    timings = {}
+    start = time.perf_counter()
+    import fastchat.conversation  # noqa: F401
+    import utils.state_manager  # noqa: F401
+    import utils.vicuna  # noqa: F401
+    from . import vicuna_client  # noqa: F401
+    controller_address, model_name = _resolve_model(controller_address,
+                                                    model_name)
+    _logger()
+    timings["imports"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    conv = _create_opener_conversation([], opener_prompt)
+    prefix = _prompt_prefix_cache.get(
+        (_prompt_prefix_cache.text_key(conv.system), None, conv.sep),
+        lambda: _render_opener_prefix(conv, None))
+    measure_tokens(prefix.text)
+    timings["prompt"] = time.perf_counter() - start
+
+    workers = []
+    start = time.perf_counter()
+    if connect:
+        try:
+            workers = _get_vicuna_client(controller_address).list_workers(
+                model_name)
+        except Exception as e:
+            _logger().warning(f"Opener warmup could not connect: {e}")
+    timings["connect"] = time.perf_counter() - start
+    timings["workers"] = len(workers)
+    return timings
+
+
+def get_prompt_cache_stats():
+    """
+    Report the hit and miss counters of the opener prompt-prefix cache.
+
+    Returns:
+        dict: Hits, misses, evictions, current size and hit rate of the
+              cache.
+    """
+    return _prompt_prefix_cache.stats()
+
+
+def get_knowledge_packing_stats():
+    """
+    Report how much external knowledge was kept and dropped.
+
+    Knowledge is only packed when `GlobalConfig.opener_knowledge_token_budget`
+    is set.
+
+    Returns:
+        dict: Number of packings and the tokens and snippets kept and
+              dropped in total.
+    """
+    return packing_stats()
+
+
+def enable_opener_pool(**pool_options):
+    """
+    Serve empty-history openers from a pool of pre-generated openers.
+
+    The pool is refilled in the background from the model, so sessions
+    starting without history get their opener without waiting for the model.
+    Calling this again replaces the current pool.
+
+    Args:
+        **pool_options: Keyword arguments forwarded to `OpenerPool`, such as
+                        `max_size`, `low_watermark`, `ttl` and
+                        `dedup_window`.
+
+    Returns:
+        OpenerPool: The started pool, e.g. to inspect `stats()`.
+    """
+    global _opener_pool
+    disable_opener_pool()
+    _opener_pool = OpenerPool(_generate_pooled_opener, **pool_options).start()
+    return _opener_pool
+
+
+def disable_opener_pool():
+    """Stop the opener pool and request every opener from the model."""
+    global _opener_pool
+    pool, _opener_pool = _opener_pool, None
+    if pool is not None:
+        pool.stop()
+
+
+def get_opener_path_stats():
+    """
+    Report how often each opener path has been taken.
+
+    The paths are "model" and "hedge" for model responses from the primary
+    and the hedge worker, "pool" for pooled openers served to empty
+    histories, and "deadline_*" / "error_*" for requests that missed their
+    latency budget or failed and were answered from the pool or the
+    fallback openers instead. Model requests made by the pool to refill
+    itself are counted separately as "pool_refill".
+
+    Returns:
+        dict: Mapping of path name to number of requests.
+    """
+    return _opener_paths.snapshot()
+
+
+def add_stage_observer(observer):
+    """
+    Report the duration of each stage of the opener pipeline.
+
+    The stages are "history" (reading the state manager), "build"
+    (conversation), "render" (knowledge and prompt), "model" (model
+    request) and "filter" (response filtering).
+
+    Args:
+        observer (callable): Called as `observer(stage, seconds)` after each
+                             stage, possibly from several threads.
+    """
+    global _stage_observers
+    _stage_observers = _stage_observers + (observer,)
+
+
+def remove_stage_observer(observer):
+    """
+    Stop reporting stage durations to an observer.
+
+    Args:
+        observer (callable): An observer passed to `add_stage_observer`.
+    """
+    global _stage_observers
+    _stage_observers = tuple(o for o in _stage_observers if o != observer)
+
+
+def enable_metrics():
+    """
+    Start recording metrics of the opener pipeline.
+
+    Records histograms of the stage durations, prompt token counts and
+    response lengths, and counters of the opener paths and of fallbacks by
+    exception type. While disabled, the pipeline records nothing.
+
+    Returns:
+        OpenerMetrics: The metrics being recorded.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = OpenerMetrics()
+        add_stage_observer(_metrics.observe_stage)
+    return _metrics
+
+
+def disable_metrics():
+    """Stop recording metrics and discard the recorded values."""
+    global _metrics
+    metrics, _metrics = _metrics, None
+    if metrics is not None:
+        remove_stage_observer(metrics.observe_stage)
+
+
+def get_metrics():
+    """
+    Return the recorded metrics for programmatic use.
+
+    Returns:
+        dict: Mapping of metric name to its values, empty while metrics are
+              disabled.
+    """
+    metrics = _metrics
+    return metrics.registry.snapshot() if metrics is not None else {}
+
+
+def render_metrics():
+    """
+    Render the recorded metrics in the Prometheus text format.
+
+    Returns:
+        str: The exposition text, empty while metrics are disabled.
+    """
+    metrics = _metrics
+    return metrics.registry.render_prometheus() if metrics is not None else ""
+
+
+def enable_prompt_log(path, sample_rate=0.01, max_bytes=256 * 1024 * 1024):
+    """
+    Log a sample of opener prompts and responses in the background.
+
+    Records are written as JSON Lines with the `Opener_prompt`, `text` and
+    `response` keys read by `log2html_converter.organize_logs`, plus the
+    full `prompt`. Serialization and file I/O happen on a background thread
+    and records are dropped rather than delaying an opener. Calling this
+    again replaces the current log.
+
+    Args:
+        path (str): The JSON Lines file to append to.
+        sample_rate (float): Fraction of openers to log, from 0 to 1.
+        max_bytes (int): Size at which the log file is rotated.
+
+    Returns:
+        PromptLogWriter: The writer, e.g. to inspect its counters.
+    """
+    global _prompt_log
+    disable_prompt_log()
+    _prompt_log = PromptLogWriter(path, sample_rate, max_bytes)
+    return _prompt_log
+
+
+def disable_prompt_log():
+    """Stop logging prompts, after writing the records already queued."""
+    global _prompt_log
+    prompt_log, _prompt_log = _prompt_log, None
+    if prompt_log is not None:
+        prompt_log.close()
+
+
+def enable_response_cache(directory, max_bytes=512 * 1024 * 1024):
+    """
+    Answer repeated model requests from a persistent on-disk cache.
+
+    Requests are keyed on the rendered prompt, stop token, model name,
+    max_new_tokens and sampling temperature, so rerunning an evaluation
+    only sends the changed prompts to the model. Meant for offline
+    evaluation: with the cache enabled, identical requests always get the
+    same sampled opener.
+
+    Args:
+        directory (str): Directory holding the cached responses, shared
+                         between runs.
+        max_bytes (int): Size limit of the directory; the least recently
+                         used responses are evicted beyond it.
+
+    Returns:
+        ResponseCache: The cache, e.g. to inspect `stats()`.
+    """
+    global _response_cache
+    _response_cache = ResponseCache(directory, max_bytes)
+    return _response_cache
+
+
+def disable_response_cache():
+    """Send every request to the model again. The cached files are kept."""
+    global _response_cache
+    _response_cache = None
+
+
+def get_response_cache_stats():
+    """
+    Report the counters of the response cache.
+
+    Returns:
+        dict: Hits, misses, evictions, size and hit rate, or None if the
+              cache is disabled.
+    """
+    cache = _response_cache
+    return cache.stats() if cache is not None else None
+
+
+def enable_adaptive_generation(target_percentile=95.0,
+                               stop_sequences=(_OPENER_DELIMITER,),
+                               **budget_options):
+    """
+    Generate only as many tokens as the openers actually keep.
+
+    The max_new_tokens of each request becomes an upper bound: the
+    request asks for the token count that covered `target_percentile`
+    percent of the recent filtered openers (see `AdaptiveTokenBudget`),
+    and the worker also stops at `stop_sequences`, so it does not decode
+    text that the filter would discard. Calling this again starts
+    learning anew.
+
+    Args:
+        target_percentile (float): Percentage of openers the budget should
+                                   cover completely.
+        stop_sequences (tuple): Extra stop sequences sent to the worker
+                                besides the separator and the user role.
+                                Pass () for workers that accept only one.
+        **budget_options: Keyword arguments forwarded to
+                          `AdaptiveTokenBudget`, such as `headroom`,
+                          `min_tokens` and `window`.
+
+    Returns:
+        AdaptiveTokenBudget: The budget, e.g. to inspect `stats()`.
+    """
+    global _token_budget, _extra_stops
+    _extra_stops = tuple(stop_sequences)
+    _token_budget = AdaptiveTokenBudget(target_percentile, **budget_options)
+    return _token_budget
+
+
+def disable_adaptive_generation():
+    """Request the caller's max_new_tokens with the single stop token."""
+    global _token_budget, _extra_stops
+    _token_budget = None
+    _extra_stops = ()
+
+
+def get_generation_stats():
+    """
+    Report the adaptive budget and the tokens generated versus kept.
+
+    Returns:
+        dict: Requests, truncated generations, the current budget and the
+              tokens budgeted, generated and kept, or None if adaptive
+              generation is disabled.
+    """
+    budget = _token_budget
+    return budget.stats() if budget is not None else None
+
+
 def _get_fallback_opener():
     """
     Retrieve a fallback conversation opener.
@@ -83,7 +632,78 @@ def _get_fallback_opener():
     return random.choice(fallback_openers)
 
 
-def _create_opener_conversation(history):
+class _StageTimer:
+    """Context manager reporting its duration to the stage observers."""
+
+    __slots__ = ("stage", "observers", "start")
+
+    def __init__(self, stage, observers):
+        self.stage = stage
+        self.observers = observers
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        for observer in self.observers:
+            observer(self.stage, seconds)
+
+
+def _timed_stage(stage):
+    """
+    Time a pipeline stage if any stage observer is registered.
+
+    Args:
+        stage (str): The name of the stage.
+
+    Returns:
+        A context manager, which does nothing when timing is disabled.
+    """
+    observers = _stage_observers
+    if not observers:
+        return _NO_TIMING
+    return _StageTimer(stage, observers)
+
+
+def _count_path(path):
+    """
+    Count an opener request by the path it took.
+
+    Args:
+        path (str): The name of the path, see `get_opener_path_stats`.
+    """
+    _opener_paths.increment(path)
+    metrics = _metrics
+    if metrics is not None:
+        metrics.paths.inc(path)
+
+
+def _record_response(history, prompt, dialogue_response, opener_prompt=None):
+    """
+    Record the response metrics and prompt log entry, if enabled.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        prompt (str): The prompt sent to the model.
+        dialogue_response (str): The filtered response.
+        opener_prompt (str, optional): The opener prompt used instead of
+                                       `GlobalConfig.opener_prompt`.
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.record_response(measure_tokens(prompt), dialogue_response)
+    prompt_log = _prompt_log
+    # Sample first, so unsampled responses skip building the record
+    if prompt_log is not None and prompt_log.sample():
+        user_texts = [turn["user"] for turn in history if turn.get("user")]
+        prompt_log.write(opener_prompt or _config().opener_prompt,
+                         user_texts[-1] if user_texts else "",
+                         dialogue_response, prompt=prompt)
+
+
+def _create_opener_conversation(history, opener_prompt=None):
     """
     Create a conversation object for the opener.
 
@@ -93,16 +713,20 @@ def _create_opener_conversation(history):
     Args:
         history (list): A list of dictionaries containing the history of the
                         conversation.
+        opener_prompt (str, optional): The system prompt, by default
+                                       `GlobalConfig.opener_prompt`.
 
     Returns:
         Conversation: A Conversation object containing the history of the
                       conversation.
     """
+    from fastchat.conversation import Conversation, SeparatorStyle
+
     # Create conversation object
     conv = Conversation(
-        system=GC.opener_prompt,
+        system=opener_prompt or _config().opener_prompt,
         roles=("Human", "Assistant"),
-        messages=(),
+        messages=[],
         offset=2,
         sep_style=SeparatorStyle.SINGLE,
         sep="</s>",
@@ -142,7 +766,47 @@ def _add_external_knowledge_to_conv(conv, external_knowledge):
         )
 
 
-def _get_prompt(conv, continued_generation):
+def _render_opener_prefix(conv, external_knowledge):
+    """
+    Render the static prefix of the opener prompt.
+
+    The prefix is the system message, including the external knowledge,
+    followed by the separator, as rendered by `SeparatorStyle.SINGLE`.
+
+    Args:
+        conv (Conversation): A Conversation object whose system message is
+                             the opener prompt.
+        external_knowledge (str): A string containing the external knowledge
+                                  to be added to the opener.
+
+    Returns:
+        tuple: The system message and the rendered prefix.
+    """
+    _add_external_knowledge_to_conv(conv, external_knowledge)
+    return conv.system, conv.system + conv.sep
+
+
+def _render_messages(conv):
+    """
+    Render the conversation turns the way `SeparatorStyle.SINGLE` does.
+
+    Args:
+        conv (Conversation): A Conversation object containing the history of
+                             the conversation.
+
+    Returns:
+        str: The rendered turns, without the system prefix.
+    """
+    parts = []
+    for role, message in conv.messages:
+        if message:
+            parts.append(role + ": " + message + conv.sep)
+        else:
+            parts.append(role + ":")
+    return "".join(parts)
+
+
+def _get_prompt(conv, continued_generation, prefix=None, turns=None):
     """
     Get the prompt for the opener from the conversation.
 
@@ -154,16 +818,107 @@ def _get_prompt(conv, continued_generation):
                              the conversation.
         continued_generation (bool): A boolean indicating whether or not the
                                      conversation is continuing.
+        prefix (str, optional): The already rendered system prefix. When
+                                given only the turns are rendered.
+        turns (str, optional): The already rendered turns, used together
+                               with the prefix.
 
     Returns:
         str: A string containing the prompt for the opener.
     """
-    prompt = conv.get_prompt()
+    if prefix is None:
+        prompt = conv.get_prompt()
+    elif turns is None:
+        prompt = prefix + _render_messages(conv)
+    else:
+        prompt = prefix + turns
     if continued_generation and prompt.endswith(conv.sep):
         prompt = prompt[:-len(conv.sep)]
     return prompt
 
 
+def _get_prompt_builder(state_manager):
+    """
+    Return the incremental prompt builder of a session.
+
+    Args:
+        state_manager (StateManager, optional): The state manager of the
+                                                session.
+
+    Returns:
+        IncrementalPromptBuilder: The session's builder, or None if the
+                                  session cannot be tracked.
+    """
+    if state_manager is None:
+        return None
+    with _prompt_builders_lock:
+        try:
+            builder = _prompt_builders.get(state_manager)
+        except TypeError:
+            # The state manager cannot be weakly referenced.
+            return None
+        if builder is None:
+            builder = IncrementalPromptBuilder(
+                _create_opener_conversation([]),
+                token_budget=getattr(
+                    _config(), "opener_history_token_budget", None),
+                count_tokens=count_tokens)
+            _prompt_builders[state_manager] = builder
+    return builder
+
+
+def _prepare_opener_prompt(history, continued_generation, external_knowledge,
+                           state_manager=None, opener_prompt=None):
+    """
+    Build the conversation, prompt and stop token for an opener request.
+
+    With a state manager, the session's conversation is updated
+    incrementally instead of being rebuilt from the whole history.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        continued_generation (bool): A boolean indicating whether or not the
+                                     conversation is continuing.
+        external_knowledge (str, optional): External knowledge to be added to
+                                             the opener.
+        state_manager (StateManager, optional): The state manager of the
+                                                session.
+        opener_prompt (str, optional): The system prompt, by default
+                                       `GlobalConfig.opener_prompt`.
+
+    Returns:
+        tuple: The Conversation object, the prompt string and the stop token.
+    """
+    # Make prompt
+    with _timed_stage("build"):
+        system = opener_prompt or _config().opener_prompt
+        builder = _get_prompt_builder(state_manager)
+        if builder is None:
+            conv = _create_opener_conversation(history, system)
+            turns = None
+        else:
+            conv, turns = builder.update(history)
+            conv.system = system
+    with _timed_stage("render"):
+        # Keep only the most relevant knowledge within the token budget
+        knowledge_budget = getattr(_config(), "opener_knowledge_token_budget",
+                                   None)
+        if external_knowledge and knowledge_budget is not None:
+            external_knowledge = pack_knowledge(
+                external_knowledge, history, knowledge_budget).text
+        # Add external knowledge, reusing the rendered prefix when cached
+        prefix = _prompt_prefix_cache.get(
+            (_prompt_prefix_cache.text_key(system),
+             _prompt_prefix_cache.text_key(external_knowledge), conv.sep),
+            lambda: _render_opener_prefix(conv, external_knowledge))
+        conv.system = prefix.system
+        # Get prompt
+        prompt = _get_prompt(conv, continued_generation, prefix.text, turns)
+    stop_token = conv.sep+conv.roles[0]
+    return conv, prompt, stop_token
+
+
 def _filter_response(response, prompt, conv, continued_generation, **kwargs):
     """
     Filter the response from the model.
@@ -182,22 +937,347 @@ def _filter_response(response, prompt, conv, continued_generation, **kwargs):
     Returns:
         str: A string containing the filtered response from the model.
     """
+    from utils.vicuna import filter_main_dialogue_output
     dialogue_response = filter_main_dialogue_output(
         response, prompt, conv,
         continued_generation, **kwargs)
-    dialogue_response = dialogue_response.split("###")[0]
+    dialogue_response = dialogue_response.split(_OPENER_DELIMITER)[0]
     return dialogue_response
 
 
+def _strip_partial_stop(text, stops):
+    """
+    Hold back a trailing fragment that may grow into a stop sequence.
+
+    Args:
+        text (str): The partial response.
+        stops (list): The stop sequences.
+
+    Returns:
+        str: The text without a trailing proper prefix of any stop sequence.
+    """
+    for stop in stops:
+        for length in range(min(len(stop) - 1, len(text)), 0, -1):
+            if text.endswith(stop[:length]):
+                return text[:-length]
+    return text
+
+
+def _generation_settings(stop_token, max_new_tokens):
+    """
+    Apply the adaptive generation policy to a model request, if enabled.
+
+    Args:
+        stop_token (str): The stop token of the conversation.
+        max_new_tokens (int): The caller's maximum number of new tokens.
+
+    Returns:
+        tuple: The stop sequence(s) and the number of tokens to request.
+    """
+    budget = _token_budget
+    if budget is None:
+        return stop_token, max_new_tokens
+    stops = (stop_token,) + _extra_stops if _extra_stops else stop_token
+    return stops, budget.budget(max_new_tokens)
+
+
+def _observe_generation(prompt, response, dialogue_response, max_new_tokens,
+                        stop_token):
+    """
+    Teach the adaptive budget the lengths of a finished generation.
+
+    The worker's finish reason tells whether the budget cut the generation
+    short. Without one, a generation counts as cut short unless a stop
+    sequence shows up in it, since token estimates cannot be compared with
+    the budget reliably. Token counts reported by the worker replace the
+    estimates, scaling the kept tokens by the same ratio. Responses from
+    the response cache are skipped: nothing was generated for them, and
+    the worker's report is not cached with them.
+
+    Args:
+        prompt (str): The prompt sent to the model.
+        response (str): The output of the model, including the echoed
+                        prompt; a `GenerationOutput` carries the finish
+                        reason and token count reported by the worker.
+        dialogue_response (str): The filtered response.
+        max_new_tokens (int): The number of tokens requested.
+        stop_token (str): The stop token of the conversation.
+    """
+    budget = _token_budget
+    if budget is None or isinstance(response, CachedResponse):
+        return
+    generated = response[len(prompt):] if response.startswith(prompt) \
+        else response
+    generated_tokens = measure_tokens(generated)
+    kept_tokens = measure_tokens(dialogue_response)
+    completion_tokens = getattr(response, "completion_tokens", None)
+    if completion_tokens is not None and generated_tokens:
+        kept_tokens = min(completion_tokens, round(
+            kept_tokens * completion_tokens / generated_tokens))
+        generated_tokens = completion_tokens
+    finish_reason = getattr(response, "finish_reason", None)
+    if finish_reason is not None:
+        truncated = finish_reason == "length"
+    else:
+        truncated = not any(stop in generated
+                            for stop in (_OPENER_DELIMITER, stop_token))
+    budget.observe(max_new_tokens, generated_tokens, kept_tokens, truncated)
+    metrics = _metrics
+    if metrics is not None:
+        metrics.record_generation(max_new_tokens, generated_tokens,
+                                  kept_tokens)
+
+
+def _request_opener_response(
+    history,
+    controller_address,
+    worker_address,
+    model_name,
+    max_new_tokens,
+    continued_generation,
+    external_knowledge,
+    state_manager=None,
+    opener_prompt=None,
+    timeout=None,
+    **kwargs
+):
+    """
+    Request an opener from the model and filter it.
+
+    Unlike `_get_opener_response`, errors are not replaced by a fallback
+    opener but propagated to the caller. The response is not recorded in
+    the metrics, prompt log and adaptive budget until the caller calls the
+    returned function, so responses discarded at a deadline are not.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        controller_address (str): The address of the controller.
+        worker_address (str, optional): The address of the worker.
+        model_name (str): The name of the model to be used.
+        max_new_tokens (int): The maximum number of new tokens to be generated.
+        continued_generation (bool): Whether to continue the generation.
+        external_knowledge (str, optional): External knowledge to be added to
+                                             the opener.
+        state_manager (StateManager, optional): The state manager of the
+                                                session.
+        opener_prompt (str, optional): The system prompt, by default
+                                       `GlobalConfig.opener_prompt`.
+        timeout (float, optional): Seconds the model request may take.
+        **kwargs: Additional keyword arguments.
+
+    Returns:
+        tuple: The filtered dialogue response and a function without
+               arguments that records it.
+    """
+    conv, prompt, stop_token = _prepare_opener_prompt(
+        history, continued_generation, external_knowledge, state_manager,
+        opener_prompt)
+    stops, max_new_tokens = _generation_settings(stop_token, max_new_tokens)
+    # Make request
+    with _timed_stage("model"):
+        response = _request_model(
+            prompt, stops, controller_address, worker_address,
+            model_name, max_new_tokens, timeout)
+    # Filter response
+    with _timed_stage("filter"):
+        dialogue_response = _filter_response(
+            response, prompt, conv, continued_generation, **kwargs)
+    record = functools.partial(
+        _record_served_response, history, prompt, response,
+        dialogue_response, max_new_tokens, stop_token, opener_prompt)
+    return dialogue_response, record
+
+
+async def _arequest_opener_response(
+    history,
+    controller_address,
+    worker_address,
+    model_name,
+    max_new_tokens,
+    continued_generation,
+    external_knowledge,
+    state_manager=None,
+    timeout=None,
+    **kwargs
+):
+    """
+    Request an opener without blocking the event loop and filter it.
+
+    The asyncio counterpart of `_request_opener_response`, sending the
+    request through the shared `OpenerDispatcher`.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        controller_address (str): The address of the controller.
+        worker_address (str, optional): The address of the worker.
+        model_name (str): The name of the model to be used.
+        max_new_tokens (int): The maximum number of new tokens to be generated.
+        continued_generation (bool): Whether to continue the generation.
+        external_knowledge (str, optional): External knowledge to be added to
+                                             the opener.
+        state_manager (StateManager, optional): The state manager of the
+                                                session.
+        timeout (float, optional): Seconds the model request may take.
+        **kwargs: Additional keyword arguments.
+
+    Returns:
+        tuple: The filtered dialogue response and a function without
+               arguments that records it.
+    """
+    conv, prompt, stop_token = _prepare_opener_prompt(
+        history, continued_generation, external_knowledge, state_manager)
+    stops, max_new_tokens = _generation_settings(stop_token, max_new_tokens)
+    # Make request
+    with _timed_stage("model"):
+        response = await _get_opener_dispatcher().submit(
+            prompt, stops, controller_address, worker_address,
+            model_name, max_new_tokens, timeout)
+    # Filter response
+    with _timed_stage("filter"):
+        dialogue_response = _filter_response(
+            response, prompt, conv, continued_generation, **kwargs)
+    record = functools.partial(
+        _record_served_response, history, prompt, response,
+        dialogue_response, max_new_tokens, stop_token)
+    return dialogue_response, record
+
+
+def _record_served_response(history, prompt, response, dialogue_response,
+                            max_new_tokens, stop_token, opener_prompt=None):
+    """
+    Record an opener response that is served to the user.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        prompt (str): The prompt sent to the model.
+        response (str): The output of the model.
+        dialogue_response (str): The filtered response.
+        max_new_tokens (int): The number of tokens requested.
+        stop_token (str): The stop token of the conversation.
+        opener_prompt (str, optional): The opener prompt used instead of
+                                       `GlobalConfig.opener_prompt`.
+    """
+    _observe_generation(prompt, response, dialogue_response, max_new_tokens,
+                        stop_token)
+    _record_response(history, prompt, dialogue_response, opener_prompt)
+
+
+def _is_empty_history(history):
+    """
+    Check whether a history contains nothing the opener could refer to.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+
+    Returns:
+        bool: True if no turn contains user or bot text.
+    """
+    return not any(turn.get("user") or turn.get("bot") for turn in history)
+
+
+def _take_pooled_opener(history, external_knowledge):
+    """
+    Take a pre-generated opener if the pool can serve this request.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        external_knowledge (str, optional): External knowledge the opener
+                                             should be based on.
+
+    Returns:
+        str: A pooled opener, or None if the model has to be asked.
+    """
+    pool = _opener_pool
+    if pool is None or not _is_empty_history(history):
+        return None
+    return pool.take(external_knowledge)
+
+
+def _get_backup_opener(external_knowledge, reason, exception=None):
+    """
+    Get an opener when the model did not deliver one.
+
+    A pooled opener is preferred, regardless of the history, over the
+    predefined fallback openers.
+
+    Args:
+        external_knowledge (str, optional): External knowledge the opener
+                                             should be based on.
+        reason (str): Why the model did not deliver, "deadline" or "error".
+        exception (BaseException, optional): The error that occurred.
+
+    Returns:
+        str: A pooled or fallback opener.
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.record_fallback(reason, exception)
+    pool = _opener_pool
+    opener = pool.take(external_knowledge) if pool is not None else None
+    if opener is not None:
+        _count_path(f"{reason}_pool")
+        return opener
+    _count_path(f"{reason}_fallback")
+    return _get_fallback_opener()
+
+
+def _get_deadline_executor():
+    """
+    Return the thread pool running requests under a latency budget.
+
+    Returns:
+        ThreadPoolExecutor: The executor, created on first use.
+    """
+    global _deadline_executor
+    if _deadline_executor is None:
+        _deadline_executor = ThreadPoolExecutor(
+            max_workers=64, thread_name_prefix="opener-deadline")
+    return _deadline_executor
+
+
+def _generate_pooled_opener(external_knowledge):
+    """
+    Generate an opener for the pool from an empty history.
+
+    Refills are counted as the "pool_refill" path. They are not recorded
+    as responses, since they are not served yet and would skew the
+    response metrics, the prompt log and the adaptive token budget.
+
+    Args:
+        external_knowledge (str, optional): External knowledge the opener
+                                             should be based on.
+
+    Returns:
+        str: The filtered opener, or None if it came out empty.
+    """
+    controller_address, model_name = _resolve_model(None, None)
+    opener, _ = _request_opener_response(
+        [], controller_address, None, model_name, 64, False,
+        external_knowledge)
+    _count_path("pool_refill")
+    opener = opener.strip()
+    return opener or None
+
+
 def _get_opener_response(
     history,
-    controller_address=GC.controller_address,
+    controller_address=None,
     worker_address=None,
-    model_name=GC.model_name,
+    model_name=None,
     max_new_tokens=64,
     continued_generation=False,
     external_knowledge=None,
     state_manager=None,
+    latency_budget=None,
+    hedge_worker_address=None,
+    hedge_delay=None,
+    opener_prompt=None,
+    use_backup=True,
     **kwargs
 ):
     """
@@ -211,9 +1291,12 @@ def _get_opener_response(
     Args:
         history (list): A list of dictionaries containing the history of the
                         conversation.
-        controller_address (str): The address of the controller.
+        controller_address (str, optional): The address of the controller,
+                                            by default
+                                            `GlobalConfig.controller_address`.
         worker_address (str, optional): The address of the worker.
-        model_name (str): The name of the model to be used.
+        model_name (str, optional): The name of the model to be used, by
+                                    default `GlobalConfig.model_name`.
         max_new_tokens (int): The maximum number of new tokens to be generated.
         continued_generation (bool): Whether to continue the generation.
         external_knowledge (str, optional): External knowledge to be added to
@@ -222,29 +1305,373 @@ def _get_opener_response(
                                                 that contains the current state
                                                 and history of the
                                                 conversation.
+        latency_budget (float, optional): Seconds to wait for the model. If
+                                          no response arrives in time, a
+                                          pooled or fallback opener is
+                                          returned instead.
+        hedge_worker_address (str, optional): The address of a second worker
+                                              that receives a duplicate
+                                              request when the first one is
+                                              slow. Requires latency_budget.
+        hedge_delay (float, optional): Seconds to wait before sending the
+                                       duplicate request. Defaults to half
+                                       of the latency budget.
+        opener_prompt (str, optional): The system prompt, by default
+                                       `GlobalConfig.opener_prompt`.
+        use_backup (bool): Whether pooled and fallback openers may stand in
+                           for the model. If False, errors and missed
+                           deadlines are raised instead.
         **kwargs: Additional keyword arguments.
 
     Returns:
         dict: A dictionary containing the dialogue response.
     """
+    controller_address, model_name = _resolve_model(controller_address,
+                                                    model_name)
+    if use_backup:
+        pooled_opener = _take_pooled_opener(history, external_knowledge)
+        if pooled_opener is not None:
+            _count_path("pool")
+            return {"dialogue_response": pooled_opener}
+    request = functools.partial(
+        _request_opener_response, history, controller_address,
+        worker_address, model_name, max_new_tokens, continued_generation,
+        external_knowledge, state_manager, opener_prompt, **kwargs)
     try:
-        # Make prompt
-        conv = _create_opener_conversation(history)
-        # Add external knowledge
-        _add_external_knowledge_to_conv(conv, external_knowledge)
-        # Get prompt
-        prompt = _get_prompt(conv, continued_generation)
-        stop_token = conv.sep+conv.roles[0]
-        # Make request
-        response = make_request_to_vicuna_model(
-            prompt, stop_token, controller_address, worker_address,
-            model_name, max_new_tokens)
-        # Debug log
-        my_debug_logger.debug(f"Opener response prompt: {prompt}")
-        # Filter response
-        dialogue_response = _filter_response(
-            response, prompt, conv, continued_generation, **kwargs)
+        if latency_budget is None:
+            (dialogue_response, record), path = request(), "model"
+        else:
+            hedge = None
+            if hedge_worker_address is not None:
+                hedge = functools.partial(
+                    _request_opener_response, history, controller_address,
+                    hedge_worker_address, model_name, max_new_tokens,
+                    continued_generation, external_knowledge, state_manager,
+                    opener_prompt, **kwargs)
+            (dialogue_response, record), path = call_with_deadline(
+                _get_deadline_executor(), request, latency_budget,
+                hedge, hedge_delay)
+            path = "model" if path == "primary" else path
+        record()
+        _count_path(path)
         return {"dialogue_response": dialogue_response}
+    except DeadlineExceeded as e:
+        _logger().warning(
+            f"Opener missed its latency budget of {latency_budget}s")
+        if not use_backup:
+            raise
+        return {"dialogue_response": _get_backup_opener(
+            external_knowledge, "deadline", e)}
+    except Exception as e:
+        _logger().error(f"Error in get_opener_response: {e}")
+        if not use_backup:
+            raise
+        return {"dialogue_response": _get_backup_opener(
+            external_knowledge, "error", e)}
+
+
+def _get_opener_dispatcher():
+    """
+    Return the process-wide opener dispatcher, creating it on first use.
+
+    Returns:
+        OpenerDispatcher: The dispatcher used by the asynchronous opener
+                          path.
+    """
+    global _opener_dispatcher
+    if _opener_dispatcher is None:
+        # Deferred, since only asyncio applications need it
+        from .opener_dispatch import OpenerDispatcher
+        try:
+            import aiohttp  # noqa: F401
+            request_fn = _arequest_model
+        except ImportError:
+            # Blocking requests, limited by the dispatcher's threads
+            request_fn = _request_model
+        _opener_dispatcher = OpenerDispatcher(request_fn)
+    return _opener_dispatcher
+
+
+async def _aget_opener_response(
+    history,
+    controller_address=None,
+    worker_address=None,
+    model_name=None,
+    max_new_tokens=64,
+    continued_generation=False,
+    external_knowledge=None,
+    state_manager=None,
+    latency_budget=None,
+    hedge_worker_address=None,
+    hedge_delay=None,
+    **kwargs
+):
+    """
+    Asynchronously generate a dialogue response for the conversation opener.
+
+    Works like `_get_opener_response`, but the model request is submitted to
+    the shared `OpenerDispatcher` and awaited instead of blocking the caller.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        controller_address (str, optional): The address of the controller,
+                                            by default
+                                            `GlobalConfig.controller_address`.
+        worker_address (str, optional): The address of the worker.
+        model_name (str, optional): The name of the model to be used, by
+                                    default `GlobalConfig.model_name`.
+        max_new_tokens (int): The maximum number of new tokens to be generated.
+        continued_generation (bool): Whether to continue the generation.
+        external_knowledge (str, optional): External knowledge to be added to
+                                             the opener.
+        state_manager (StateManager, optional): An instance of StateManager
+                                                that contains the current state
+                                                and history of the
+                                                conversation.
+        latency_budget (float, optional): Seconds to wait for the model. If
+                                          no response arrives in time, the
+                                          request is cancelled and a pooled
+                                          or fallback opener is returned
+                                          instead.
+        hedge_worker_address (str, optional): The address of a second worker
+                                              that receives a duplicate
+                                              request when the first one is
+                                              slow. Requires latency_budget.
+        hedge_delay (float, optional): Seconds to wait before sending the
+                                       duplicate request. Defaults to half
+                                       of the latency budget.
+        **kwargs: Additional keyword arguments.
+
+    Returns:
+        dict: A dictionary containing the dialogue response.
+    """
+    controller_address, model_name = _resolve_model(controller_address,
+                                                    model_name)
+    pooled_opener = _take_pooled_opener(history, external_knowledge)
+    if pooled_opener is not None:
+        _count_path("pool")
+        return {"dialogue_response": pooled_opener}
+    request = functools.partial(
+        _arequest_opener_response, history, controller_address,
+        worker_address, model_name, max_new_tokens, continued_generation,
+        external_knowledge, state_manager, **kwargs)
+    try:
+        if latency_budget is None:
+            (dialogue_response, record), path = await request(), "model"
+        else:
+            hedge = None
+            if hedge_worker_address is not None:
+                hedge = functools.partial(
+                    _arequest_opener_response, history, controller_address,
+                    hedge_worker_address, model_name, max_new_tokens,
+                    continued_generation, external_knowledge, state_manager,
+                    **kwargs)
+            (dialogue_response, record), path = await acall_with_deadline(
+                request, latency_budget, hedge, hedge_delay)
+            path = "model" if path == "primary" else path
+        record()
+        _count_path(path)
+        return {"dialogue_response": dialogue_response}
+    except DeadlineExceeded as e:
+        _logger().warning(
+            f"Opener missed its latency budget of {latency_budget}s")
+        return {"dialogue_response": _get_backup_opener(
+            external_knowledge, "deadline", e)}
+    except Exception as e:
+        _logger().error(f"Error in aget_opener_response: {e}")
+        return {"dialogue_response": _get_backup_opener(
+            external_knowledge, "error", e)}
+
+
+def _get_vicuna_client(controller_address):
+    """
+    Return the pooled client for a controller, creating it on first use.
+
+    Args:
+        controller_address (str): The address of the controller.
+
+    Returns:
+        VicunaClient: The client talking to that controller.
+    """
+    client = _vicuna_clients.get(controller_address)
+    if client is None:
+        from .vicuna_client import VicunaClient
+        client = _vicuna_clients.setdefault(
+            controller_address, VicunaClient(controller_address))
+    return client
+
+
+def _request_model(prompt, stop_token, controller_address, worker_address,
+                   model_name, max_new_tokens, timeout=None):
+    """
+    Request a full generation through the pooled model client.
+
+    Takes the same arguments as `make_request_to_vicuna_model`, but reuses
+    the cached worker list and keep-alive connections of the client
+    instead of resolving a worker and connecting on every call. With the
+    response cache enabled, cached outputs are returned without a request.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+        stop_token (str or tuple): The stop token(s) for the generation.
+        controller_address (str): The address of the controller.
+        worker_address (str, optional): The address of the worker.
+        model_name (str): The name of the model to be used.
+        max_new_tokens (int): The maximum number of new tokens.
+        timeout (float, optional): Seconds the generation may take.
+
+    Returns:
+        str: The output of the model, including the echoed prompt.
+    """
+    cache = _response_cache
+    if cache is not None:
+        key = _response_cache_key(prompt, stop_token, model_name,
+                                  max_new_tokens)
+        response = cache.get(key)
+        if response is not None:
+            return response
+    response = _get_vicuna_client(controller_address).generate(
+        prompt, stop_token, worker_address, model_name, max_new_tokens,
+        _OPENER_TEMPERATURE, timeout)
+    if cache is not None:
+        cache.put(key, response)
+    return response
+
+
+async def _arequest_model(prompt, stop_token, controller_address,
+                          worker_address, model_name, max_new_tokens,
+                          timeout=None):
+    """
+    Request a full generation without blocking the event loop.
+
+    The asyncio counterpart of `_request_model`, used by the opener
+    dispatcher when `aiohttp` is installed.
+
+    Args:
+        prompt (str): The prompt to send to the model.
+        stop_token (str or tuple): The stop token(s) for the generation.
+        controller_address (str): The address of the controller.
+        worker_address (str, optional): The address of the worker.
+        model_name (str): The name of the model to be used.
+        max_new_tokens (int): The maximum number of new tokens.
+        timeout (float, optional): Seconds the generation may take.
+
+    Returns:
+        str: The output of the model, including the echoed prompt.
+    """
+    import asyncio
+    cache = _response_cache
+    if cache is not None:
+        key = _response_cache_key(prompt, stop_token, model_name,
+                                  max_new_tokens)
+        response = cache.get(key)
+        if response is not None:
+            return response
+    response = await asyncio.wait_for(
+        _get_vicuna_client(controller_address).agenerate(
+            prompt, stop_token, worker_address, model_name, max_new_tokens,
+            _OPENER_TEMPERATURE), timeout)
+    if cache is not None:
+        cache.put(key, response)
+    return response
+
+
+def _response_cache_key(prompt, stop_token, model_name, max_new_tokens):
+    """Return the response cache key of a model request."""
+    return ResponseCache.make_key(
+        prompt=prompt, stop=stop_token, model=model_name,
+        max_new_tokens=max_new_tokens, temperature=_OPENER_TEMPERATURE)
+
+
+def _stream_opener_response(
+    history,
+    controller_address=None,
+    worker_address=None,
+    model_name=None,
+    max_new_tokens=64,
+    continued_generation=False,
+    external_knowledge=None,
+    state_manager=None,
+    **kwargs
+):
+    """
+    Stream a dialogue response for the conversation opener.
+
+    The model output is filtered as it arrives. Once the opener delimiter or
+    the stop token shows up the opener is complete, and the stream is closed
+    so the worker stops generating tokens that would be discarded anyway.
+
+    Args:
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        controller_address (str, optional): The address of the controller,
+                                            by default
+                                            `GlobalConfig.controller_address`.
+        worker_address (str, optional): The address of the worker.
+        model_name (str, optional): The name of the model to be used, by
+                                    default `GlobalConfig.model_name`.
+        max_new_tokens (int): The maximum number of new tokens to be generated.
+        continued_generation (bool): Whether to continue the generation.
+        external_knowledge (str, optional): External knowledge to be added to
+                                             the opener.
+        state_manager (StateManager, optional): An instance of StateManager
+                                                that contains the current state
+                                                and history of the
+                                                conversation.
+        **kwargs: Additional keyword arguments.
+
+    Yields:
+        str: The filtered opener so far. Each value replaces the previous
+             one; after an error the last value is a backup opener.
+    """
+    from utils.vicuna import filter_main_dialogue_output
+    controller_address, model_name = _resolve_model(controller_address,
+                                                    model_name)
+    pooled_opener = _take_pooled_opener(history, external_knowledge)
+    if pooled_opener is not None:
+        _count_path("pool")
+        yield pooled_opener
+        return
+    try:
+        conv, prompt, stop_token = _prepare_opener_prompt(
+            history, continued_generation, external_knowledge, state_manager)
+        stops = [_OPENER_DELIMITER, stop_token]
+        worker_stops, max_new_tokens = _generation_settings(stop_token,
+                                                            max_new_tokens)
+        stream = _get_vicuna_client(controller_address).generate_stream(
+            prompt, worker_stops, worker_address, model_name, max_new_tokens)
+        output = partial = dialogue_response = ""
+        yielded = False
+        try:
+            for output in stream:
+                dialogue_response = filter_main_dialogue_output(
+                    output, prompt, conv, continued_generation, **kwargs)
+                complete = any(stop in dialogue_response for stop in stops)
+                for stop in stops:
+                    dialogue_response = dialogue_response.split(stop)[0]
+                shown = dialogue_response
+                if not complete:
+                    shown = _strip_partial_stop(dialogue_response, stops)
+                if shown != partial:
+                    partial = shown
+                    yielded = True
+                    yield partial
+                if complete:
+                    break
+        finally:
+            # Cancels the generation if the opener completed early.
+            stream.close()
+        if dialogue_response != partial or not yielded:
+            # The generation ended without a stop sequence, so the text
+            # held back as a possible one is part of the opener.
+            partial = dialogue_response
+            yield partial
+        # Metrics and prompt log
+        _observe_generation(prompt, output, partial, max_new_tokens,
+                            stop_token)
+        _record_response(history, prompt, partial)
+        _count_path("model")
     except Exception as e:
-        my_debug_logger.error(f"Error in get_opener_response: {e}")
-        return {"dialogue_response": _get_fallback_opener()}
+        _logger().error(f"Error in stream_opener_response: {e}")
+        yield _get_backup_opener(external_knowledge, "error", e)
@@ -0,0 +1,236 @@
+"""
+This script stores opener evaluation logs in a compact columnar format.
+
+In the JSON Lines logs every entry repeats the full opener prompt and
+test case. A compact log stores each distinct prompt and test case once,
+in order of first appearance, and keeps the log entries as columns: the
+prompt number, the test case number and the response of every entry.
+The file is memory-mapped when read, so only the responses that are used
+are loaded.
+
+File layout (little-endian):
+- Header: the magic bytes, the number of entries, prompts and test cases,
+    and the offsets of the sections below.
+- Responses: the UTF-8 responses concatenated, then their offsets as
+    n + 1 unsigned 64-bit integers.
+- Prompt and test case columns: one unsigned 32-bit index per entry.
+- Prompts and test cases: the UTF-8 strings concatenated, then their
+    offsets, then the positions of both.
+
+Functions:
+- convert_jsonl_to_compact: Converts a JSON Lines log into a compact log.
+- CompactLog: Reads a compact log.
+- is_compact_log: Tells whether a file is a compact log.
+
+Usage:
+python compact_log.py evaluation.log evaluation.ctlog
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # Fall back to the standard library
+    json_loads = json.loads
+
+MAGIC = b"OTLOG01\n"
+HEADER = struct.Struct("<8s3Q6Q")
+SECTIONS = ("response_offsets", "prompt_ids", "case_ids",
+            "prompts", "cases", "end")
+
+
+def is_compact_log(path):
+    """ Returns True if the file at path is a compact log. """
+    with open(path, 'rb') as input_f:
+        return input_f.read(len(MAGIC)) == MAGIC
+
+
+def convert_jsonl_to_compact(input_file, output_file):
+    """
+    Converts a JSON Lines log into a compact log.
+
+    The responses are written as the log is read, so only the distinct
+    prompts and test cases and the per-entry columns are kept in memory.
+    Null prompts, test cases and responses are stored as empty strings.
+    The output is written to a temporary file that replaces output_file
+    only once it is complete. Returns the number of log entries converted.
+    """
+    tmp_path = output_file + ".tmp"
+    try:
+        with open(input_file, 'rb') as input_f, open(tmp_path, 'wb') as output_f:
+            entries = _write_compact(input_f, output_f)
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return entries
+
+
+def _write_compact(input_f, output_f):
+    """ Writes the compact log of a JSON Lines log and returns the number of entries. """
+    prompt_numbers = {}
+    case_numbers = {}
+    prompt_ids = array('I')
+    case_ids = array('I')
+    response_offsets = array('Q', [0])
+
+    output_f.write(b"\0" * HEADER.size)
+    for line in input_f:
+        if not line.strip():
+            continue
+        log = json_loads(line)
+        prompt = log['Opener_prompt'] or ""
+        test_case = log['text'] or ""
+        prompt_ids.append(prompt_numbers.setdefault(prompt, len(prompt_numbers)))
+        case_ids.append(case_numbers.setdefault(test_case, len(case_numbers)))
+        response = (log['response'] or "").encode('utf-8')
+        output_f.write(response)
+        response_offsets.append(response_offsets[-1] + len(response))
+
+    offsets = {"response_offsets": _align(output_f)}
+    _write_array(output_f, response_offsets)
+    offsets["prompt_ids"] = _align(output_f)
+    _write_array(output_f, prompt_ids)
+    offsets["case_ids"] = _align(output_f)
+    _write_array(output_f, case_ids)
+    offsets["prompts"] = _write_strings(output_f, prompt_numbers)
+    offsets["cases"] = _write_strings(output_f, case_numbers)
+    offsets["end"] = output_f.tell()
+
+    output_f.seek(0)
+    output_f.write(HEADER.pack(MAGIC, len(prompt_ids), len(prompt_numbers),
+                               len(case_numbers), *(offsets[name] for name in SECTIONS)))
+    return len(prompt_ids)
+
+
+def _align(output_f, alignment=8):
+    """ Pads the file to the alignment and returns the new position. """
+    padding = -output_f.tell() % alignment
+    output_f.write(b"\0" * padding)
+    return output_f.tell()
+
+
+def _write_array(output_f, values):
+    """ Writes an array in little-endian byte order. """
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(output_f)
+
+
+def _write_strings(output_f, strings):
+    """ Writes strings in insertion order followed by their offsets and returns the section offset. """
+    start = _align(output_f)
+    offsets = array('Q', [0])
+    for text in strings:
+        data = text.encode('utf-8')
+        output_f.write(data)
+        offsets.append(offsets[-1] + len(data))
+    offsets_start = _align(output_f)
+    _write_array(output_f, offsets)
+    return _section_pointer(output_f, start, offsets_start)
+
+
+def _section_pointer(output_f, start, offsets_start):
+    """ Appends a (data start, offsets start) pair and returns its position. """
+    position = output_f.tell()
+    output_f.write(struct.pack("<2Q", start, offsets_start))
+    return position
+
+
+class CompactLog:
+    """
+    Memory-mapped reader of a compact log.
+
+    `prompts` and `test_cases` list the distinct strings in order of first
+    appearance. Iterating yields the log entries as dicts with the same
+    keys as the JSON Lines logs, sharing one string object per prompt and
+    test case.
+
+    The columns are read in place from the memory map on little-endian
+    machines and copied and byte-swapped on big-endian ones.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.entries, n_prompts, n_cases,
+         *offsets) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a compact log")
+        offsets = dict(zip(SECTIONS, offsets))
+        self.size = offsets["end"]
+
+        self._response_offsets = self._read_array('Q', offsets["response_offsets"], self.entries + 1)
+        self._prompt_ids = self._read_array('I', offsets["prompt_ids"], self.entries)
+        self._case_ids = self._read_array('I', offsets["case_ids"], self.entries)
+        self.prompts = self._read_strings(offsets["prompts"], n_prompts)
+        self.test_cases = self._read_strings(offsets["cases"], n_cases)
+
+    def _read_array(self, typecode, start, count):
+        """ Returns a column of the file, a memoryview on little-endian machines and a byte-swapped copy otherwise. """
+        size = array(typecode).itemsize * count
+        if sys.byteorder == "little":
+            return memoryview(self._map)[start:start + size].cast(typecode)
+        values = array(typecode, self._map[start:start + size])
+        values.byteswap()
+        return values
+
+    def _read_strings(self, pointer, count):
+        start, offsets_start = struct.unpack_from("<2Q", self._map, pointer)
+        offsets = self._read_array('Q', offsets_start, count + 1)
+        strings = [self._map[start + offsets[i]:start + offsets[i + 1]].decode('utf-8')
+                   for i in range(count)]
+        if isinstance(offsets, memoryview):
+            offsets.release()
+        return strings
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.entries
+
+    def __iter__(self):
+        return self.iter_entries(0, self.entries)
+
+    def response(self, entry):
+        """ Returns the response of the given log entry. """
+        start = HEADER.size + self._response_offsets[entry]
+        end = HEADER.size + self._response_offsets[entry + 1]
+        return self._map[start:end].decode('utf-8')
+
+    def iter_entries(self, first, last):
+        """ Yields the log entries first to last - 1 as dicts. """
+        for entry in range(first, min(last, self.entries)):
+            yield {
+                'Opener_prompt': self.prompts[self._prompt_ids[entry]],
+                'text': self.test_cases[self._case_ids[entry]],
+                'response': self.response(entry),
+            }
+
+    def close(self):
+        for name in ("_response_offsets", "_prompt_ids", "_case_ids"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._map.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python compact_log.py <input.log> <output.ctlog>")
+    entries = convert_jsonl_to_compact(sys.argv[1], sys.argv[2])
+    print(f"Converted {entries} log entries, "
+          f"{os.path.getsize(sys.argv[1]) / 1e6:.1f} MB -> {os.path.getsize(sys.argv[2]) / 1e6:.1f} MB")
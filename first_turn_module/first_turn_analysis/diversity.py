@@ -0,0 +1,298 @@
+"""
+This script measures how diverse the generated openers are.
+
+Every response is reduced to the set of its word bigrams, hashed and
+summarized by a MinHash signature, all in batched NumPy operations.
+Signatures estimate the Jaccard similarity of two responses, and
+locality-sensitive hashing over signature bands finds the candidate
+pairs of near-duplicates without comparing every pair. Near-duplicates
+are clustered as connected components of the verified pairs.
+
+For each prompt it reports:
+- distinct_2: the share of distinct word bigrams among all bigrams.
+- near_duplicate_rate: the share of responses with a near-duplicate
+    among the prompt's other responses.
+- mean_similarity: the estimated Jaccard similarity of random pairs of
+    the prompt's responses; lower means more diverse.
+
+Functions:
+- DiversityAnalyzer: Collects responses in batches and computes the
+    metrics and near-duplicate clusters.
+- analyze_logs: Runs the analysis over organized logs.
+- analyze_case_groups: Runs the analysis over the case groups of
+    ExternalLogGrouping in batches.
+- diversity_html: Renders the metrics as a section of the HTML report.
+
+Usage:
+Requires NumPy. Pass diversity=True to transform_log_to_html to add the
+metrics to the report.
+"""
+
+import html
+import string
+import time
+
+import numpy as np
+
+SEPARATOR = "\0"
+# Words are split at whitespace and punctuation other than apostrophes
+PUNCTUATION = str.maketrans({char: " " for char in string.punctuation if char != "'"})
+
+SHIFT_32 = np.uint64(32)
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+class DiversityAnalyzer:
+    """
+    Computes near-duplicate clusters and per-prompt diversity of responses.
+
+    `num_perm` MinHash permutations are split into `bands` bands for the
+    locality-sensitive hashing; pairs sharing a band are near-duplicates
+    if their estimated similarity is at least `threshold`. Each response
+    keeps its signature and a preview of `preview_chars` characters.
+    """
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.7, sample_pairs=2000,
+                 preview_chars=300, seed=0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.sample_pairs = sample_pairs
+        self.preview_chars = preview_chars
+        self.seed = seed
+        # Multiply-shift hash functions (a * x + b) >> 32 with odd a
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self._vocabulary = {SEPARATOR: 0}
+        self._signatures = []
+        self._prompts = []
+        self._prompt_shingles = []
+        self.previews = []
+
+    def add(self, prompt_numbers, responses):
+        """ Adds a batch of responses and the numbers of their prompts. """
+        if not responses:
+            return
+        # Tokenize the batch at once; the separators between responses
+        # also serve as their start and end tokens
+        delimiter = f" {SEPARATOR} "
+        text = delimiter.join(responses)
+        if text.count(SEPARATOR) != len(responses) - 1:
+            text = delimiter.join(response.replace(SEPARATOR, " ") for response in responses)
+        tokens = f"{delimiter}{text}{delimiter}".lower().translate(PUNCTUATION).split()
+        vocabulary = self._vocabulary
+        # Sorted, so the ids and thereby the results are reproducible
+        for token in sorted(set(tokens).difference(vocabulary)):
+            vocabulary[token] = len(vocabulary)
+        ids = np.fromiter(map(vocabulary.__getitem__, tokens), dtype=np.uint64,
+                          count=len(tokens))
+        self.previews.extend(response[:self.preview_chars] for response in responses)
+
+        # Bigrams of consecutive tokens; response i owns those from its
+        # start separator up to its end separator
+        separators = np.flatnonzero(ids == 0)
+        starts = separators[:-1]
+        lengths = np.diff(separators)
+        shingles = ((ids[:-1] * np.uint64(1000003) + ids[1:]) * GOLDEN) >> SHIFT_32
+
+        # Hash the distinct shingles only, then gather them per response
+        distinct, inverse = np.unique(shingles, return_inverse=True)
+        signatures = np.empty((len(responses), self.num_perm), dtype=np.uint32)
+        for j in range(self.num_perm):
+            hashed = ((self._a[j] * distinct + self._b[j]) >> SHIFT_32).astype(np.uint32)
+            signatures[:, j] = np.minimum.reduceat(hashed[inverse], starts)
+        self._signatures.append(signatures)
+
+        prompt_numbers = np.asarray(prompt_numbers, dtype=np.uint64)
+        self._prompts.append(prompt_numbers)
+        shingle_prompts = np.repeat(prompt_numbers, lengths)
+        self._prompt_shingles.append((shingle_prompts << SHIFT_32) | shingles)
+
+    def result(self, max_clusters=20):
+        """
+        Computes the metrics over every response added.
+
+        Returns a dict with the number of responses, the seconds taken, a
+        "prompts" dict of metrics by prompt number, and the largest
+        near-duplicate "clusters", each with its size, its responses per
+        prompt and an example.
+        """
+        start = time.perf_counter()
+        signatures = np.concatenate(self._signatures) if self._signatures else \
+            np.empty((0, self.num_perm), dtype=np.uint32)
+        prompts = np.concatenate(self._prompts) if self._prompts else \
+            np.empty(0, dtype=np.uint64)
+        labels = self._cluster(signatures)
+
+        # Distinct bigrams per prompt
+        prompt_shingles = np.concatenate(self._prompt_shingles) if self._prompt_shingles else \
+            np.empty(0, dtype=np.uint64)
+        shingle_owner = prompt_shingles >> SHIFT_32
+        distinct_owner = np.unique(prompt_shingles) >> SHIFT_32
+
+        # Responses sharing a cluster with another response of their prompt
+        prompt_labels = (prompts << SHIFT_32) | labels.astype(np.uint64)
+        _, inverse, counts = np.unique(prompt_labels, return_inverse=True,
+                                       return_counts=True)
+        duplicated = counts[inverse] > 1
+
+        rng = np.random.default_rng(self.seed)
+        metrics = {}
+        for prompt_number in np.unique(prompts):
+            members = np.flatnonzero(prompts == prompt_number)
+            total_bigrams = int(np.count_nonzero(shingle_owner == prompt_number))
+            distinct_bigrams = int(np.count_nonzero(distinct_owner == prompt_number))
+            metrics[int(prompt_number)] = {
+                "responses": len(members),
+                "distinct_2": distinct_bigrams / total_bigrams if total_bigrams else 0.0,
+                "near_duplicate_rate": float(duplicated[members].mean()),
+                "clusters": int(len(np.unique(labels[members]))),
+                "mean_similarity": self._mean_similarity(signatures, members, rng),
+            }
+
+        cluster_ids, cluster_sizes = np.unique(labels, return_counts=True)
+        order = np.argsort(-cluster_sizes, kind="stable")
+        clusters = []
+        for index in order[:max_clusters]:
+            if cluster_sizes[index] < 2:
+                break
+            members = np.flatnonzero(labels == cluster_ids[index])
+            member_prompts, prompt_counts = np.unique(prompts[members], return_counts=True)
+            clusters.append({
+                "size": int(cluster_sizes[index]),
+                "prompts": {int(p): int(c) for p, c in zip(member_prompts, prompt_counts)},
+                "example": self.previews[members[0]],
+            })
+
+        return {
+            "responses": len(prompts),
+            "near_duplicate_clusters": int(np.count_nonzero(cluster_sizes > 1)),
+            "seconds": time.perf_counter() - start,
+            "prompts": metrics,
+            "clusters": clusters,
+        }
+
+    def _cluster(self, signatures):
+        """ Labels each response with the smallest index of its near-duplicate cluster. """
+        count = len(signatures)
+        rows = self.num_perm // self.bands
+        edges_from = []
+        edges_to = []
+        for band in range(self.bands):
+            # Responses with the same band of their signature are candidates
+            band_keys = np.zeros(count, dtype=np.uint64)
+            for column in range(band * rows, (band + 1) * rows):
+                band_keys = (band_keys ^ signatures[:, column]) * GOLDEN
+            order = np.argsort(band_keys, kind="stable")
+            sorted_keys = band_keys[order]
+            new_bucket = np.ones(count, dtype=bool)
+            new_bucket[1:] = sorted_keys[1:] != sorted_keys[:-1]
+            # Compare every candidate with the first response of its bucket
+            heads = order[np.maximum.accumulate(np.where(new_bucket, np.arange(count), 0))]
+            candidates = ~new_bucket
+            edges_from.append(heads[candidates])
+            edges_to.append(order[candidates])
+
+        labels = np.arange(count)
+        if not count:
+            return labels
+        edges_from = np.concatenate(edges_from)
+        edges_to = np.concatenate(edges_to)
+        similar = np.empty(len(edges_from), dtype=bool)
+        for chunk in range(0, len(edges_from), 65536):
+            part = slice(chunk, chunk + 65536)
+            similar[part] = (signatures[edges_from[part]] == signatures[edges_to[part]]).mean(axis=1) >= self.threshold
+        edges_from = edges_from[similar]
+        edges_to = edges_to[similar]
+
+        # Connected components by propagating the smallest label
+        while True:
+            smallest = np.minimum(labels[edges_from], labels[edges_to])
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, edges_from, smallest)
+            np.minimum.at(new_labels, edges_to, smallest)
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def _mean_similarity(self, signatures, members, rng):
+        """ Estimates the mean similarity of random pairs of the given responses. """
+        if len(members) < 2:
+            return 0.0
+        first = rng.choice(members, self.sample_pairs)
+        second = rng.choice(members, self.sample_pairs)
+        distinct = first != second
+        if not distinct.any():
+            return 0.0
+        return float((signatures[first[distinct]] == signatures[second[distinct]]).mean())
+
+
+def analyze_logs(prompt_index, logs_by_test_case, **options):
+    """ Runs the diversity analysis over logs organized by organize_logs. """
+    analyzer = DiversityAnalyzer(**options)
+    prompt_numbers = []
+    responses = []
+    for logs in logs_by_test_case.values():
+        for log in logs:
+            prompt_numbers.append(prompt_index[log['Opener_prompt']])
+            responses.append(log['response'])
+    analyzer.add(prompt_numbers, responses)
+    return analyzer.result()
+
+
+def analyze_case_groups(case_groups, batch_size=50000, **options):
+    """ Runs the diversity analysis over (case number, test case, responses) groups in batches. """
+    analyzer = DiversityAnalyzer(**options)
+    prompt_numbers = []
+    responses = []
+    for _, _, case_responses in case_groups:
+        for prompt_number, response in case_responses:
+            prompt_numbers.append(prompt_number)
+            responses.append(response)
+        if len(responses) >= batch_size:
+            analyzer.add(prompt_numbers, responses)
+            prompt_numbers = []
+            responses = []
+    analyzer.add(prompt_numbers, responses)
+    return analyzer.result()
+
+
+def diversity_html(diversity):
+    """ Renders the diversity metrics as a section of the report. """
+    parts = ["""
+        <div id="diversitySummary" class="mb-4">
+            <h2>Diversity</h2>
+            <table class="table table-sm">
+                <thead><tr><th>Prompt</th><th>Responses</th><th>Distinct bigrams</th>
+                <th>Near-duplicate rate</th><th>Clusters</th><th>Mean similarity</th></tr></thead>
+                <tbody>
+"""]
+    for prompt_number, metrics in sorted(diversity["prompts"].items()):
+        parts.append(
+            f"<tr><td>Prompt {prompt_number}</td>"
+            f"<td>{metrics['responses']}</td><td>{metrics['distinct_2']:.3f}</td>"
+            f"<td>{metrics['near_duplicate_rate']:.3f}</td><td>{metrics['clusters']}</td>"
+            f"<td>{metrics['mean_similarity']:.3f}</td></tr>\n")
+    parts.append("""                </tbody>
+            </table>
+""")
+    if diversity["clusters"]:
+        parts.append("""            <h3>Largest near-duplicate clusters</h3>
+            <table class="table table-sm">
+                <thead><tr><th>Responses</th><th>Prompts</th><th>Example</th></tr></thead>
+                <tbody>
+""")
+        for cluster in diversity["clusters"]:
+            prompts = ", ".join(f"Prompt {number}: {count}"
+                                for number, count in sorted(cluster["prompts"].items()))
+            parts.append(f"<tr><td>{cluster['size']}</td><td>{prompts}</td>"
+                         f"<td>{html.escape(cluster['example'])}</td></tr>\n")
+        parts.append("""                </tbody>
+            </table>
+""")
+    parts.append("        </div>\n")
+    return "".join(parts)
@@ -10,6 +10,32 @@ Functions:
     log data and writes it to an output file.
 - transform_log_to_html: Main function that orchestrates the reading,
     organizing, and HTML file generation process.
+- ExternalLogGrouping: Groups log entries by test case through sorted
+    temporary runs, for logs too large to organize in memory.
+
+Large logs:
+Pass streaming=True to transform_log_to_html to group the logs with
+bounded memory and write the HTML incrementally. The output is the same
+as in the default mode, and the function returns the number of lines
+and the throughput of the conversion, and the peak memory of the process.
+
+Pass shard_size=N to write a small index page instead, together with a
+"<output name>_data" folder of JSON files holding N test cases each. The
+page fetches these files while the reviewer scrolls, and filters prompts
+and test cases over an index embedded in the page. Browsers only allow
+the page to fetch its data when served over HTTP, for example with
+"python -m http.server" in the output folder.
+
+Multiple inputs:
+input_file may also be a list of log files or a glob pattern such as
+"logs/*.log". Pass workers=N to parse the logs in N processes, each
+handling a byte range of a file; the results are merged in file and line
+order, so prompt and test case numbers are the same as with one process.
+orjson is used for parsing when it is installed.
+
+Compact logs:
+Any input may also be a compact log written by compact_log.py, which
+stores each prompt and test case once and is read memory-mapped.
 
 Usage:
 This script is intended to be used with log files in JSON format.
@@ -21,20 +47,141 @@ To use the script, call the transform_log_to_html function with the
 input log file and the desired output HTML file name as arguments.
 transform_log_to_html("path_to_example.log", 'path_to_example.html')
 """
+import glob
+import heapq
 import html
 import json
-from collections import defaultdict, OrderedDict
+import os
+import sys
+import tempfile
+import time
+import urllib.parse
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+
+from compact_log import CompactLog, is_compact_log
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # Fall back to the standard library
+    json_loads = json.loads
+
+# Size of the byte ranges handed to each worker process
+CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def expand_inputs(input_file):
+    """ Expands a log file, glob pattern or list of them into file paths. """
+    if isinstance(input_file, (str, os.PathLike)):
+        input_file = [input_file]
+    paths = []
+    for path in input_file:
+        path = os.fspath(path)
+        if not os.path.exists(path) and glob.has_magic(path):
+            paths.extend(sorted(glob.glob(path)))
+        else:
+            paths.append(path)
+    return paths
+
+
+def split_into_chunks(paths, chunk_bytes=CHUNK_BYTES):
+    """
+    Splits files into (path, start, end) ranges.
 
+    The ranges are byte ranges for JSON Lines logs and ranges of log
+    entries of about chunk_bytes for compact logs.
+    """
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if size and is_compact_log(path):
+            with CompactLog(path) as compact_log:
+                entries = len(compact_log)
+            step = max(1, entries * chunk_bytes // size)
+            chunks.extend((path, start, min(start + step, entries))
+                          for start in range(0, entries, step))
+            continue
+        for start in range(0, max(size, 1), chunk_bytes):
+            chunks.append((path, start, min(start + chunk_bytes, size)))
+    return chunks
+
+
+def parse_chunk(chunk):
+    """
+    Parses the log lines starting within a byte range of a file.
 
-def organize_logs(input_file):
-    """ Reads the log file and organizes the data by test cases. """
+    A line belongs to the range its first byte is in, so neighbouring
+    ranges never share or split a line. Identical prompts are returned as
+    the same string object to keep the results small to send between
+    processes. Returns the parsed logs and the number of bytes read.
+    """
+    path, start, end = chunk
+    if is_compact_log(path):
+        with CompactLog(path) as compact_log:
+            logs = list(compact_log.iter_entries(start, end))
+            return logs, compact_log.size * (end - start) // max(len(compact_log), 1)
+    prompts = {}
+    logs = []
+    bytes_read = 0
+    with open(path, 'rb') as input_f:
+        position = start
+        if start > 0:
+            # Skip the line that started in the previous range
+            input_f.seek(start - 1)
+            position = start - 1 + len(input_f.readline())
+        while position < end:
+            line = input_f.readline()
+            if not line:
+                break
+            position += len(line)
+            bytes_read += len(line)
+            if not line.strip():
+                continue
+            log = json_loads(line)
+            log['Opener_prompt'] = prompts.setdefault(log['Opener_prompt'],
+                                                      log['Opener_prompt'])
+            logs.append(log)
+    return logs, bytes_read
+
+
+def iter_parsed_chunks(input_file, workers=1, chunk_bytes=CHUNK_BYTES):
+    """
+    Yields the (logs, bytes read) of each chunk of the inputs in order.
+
+    With more than one worker the chunks are parsed in a process pool,
+    with at most two chunks per worker in flight to bound memory.
+    """
+    chunks = split_into_chunks(expand_inputs(input_file), chunk_bytes)
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield parse_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(chunks)
+        pending = deque(executor.submit(parse_chunk, chunk)
+                        for chunk in islice(remaining, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            for chunk in islice(remaining, 1):
+                pending.append(executor.submit(parse_chunk, chunk))
+            yield result
+
+
+def organize_logs(input_file, workers=1):
+    """ Reads the log files and organizes the data by test cases. """
     prompt_index = OrderedDict()
     logs_by_test_case = defaultdict(list)
 
-    # Reading data from the input file and organizing it
-    with open(input_file, 'r') as input_f:
-        for line in input_f:
-            log = json.loads(line)
+    # Reading data from the input files and organizing it
+    for logs, _ in iter_parsed_chunks(input_file, workers):
+        for log in logs:
             if log['Opener_prompt'] not in prompt_index:
                 prompt_index[log['Opener_prompt']] = len(prompt_index) + 1
             test_case = log['text']
@@ -45,10 +192,92 @@ def organize_logs(input_file):
     return prompt_index, logs_by_test_case
 
 
-def generate_html_content(prompt_index, logs_by_test_case):
-    """ Generates HTML content from categorized logs. """
+class ExternalLogGrouping:
+    """
+    Groups log entries by test case with bounded memory.
+
+    Only the distinct prompts and test cases are kept in memory. The
+    entries themselves are written to temporary files in sorted runs of
+    `run_size` entries, which `case_groups` merges back together. Use it
+    as a context manager so the temporary files are removed.
+    """
+
+    def __init__(self, input_file, run_size=100000, tmp_dir=None, workers=1):
+        self.input_file = input_file
+        self.run_size = run_size
+        self.workers = workers
+        self.tmp_dir = tmp_dir
+        self.prompt_index = OrderedDict()
+        self.test_cases = []
+        self.lines = 0
+        self.bytes_read = 0
+        self._run_dir = None
+        self._run_files = []
+
+    def __enter__(self):
+        self._run_dir = tempfile.TemporaryDirectory(dir=self.tmp_dir)
+        case_index = {}
+        run = []
+        for logs, bytes_read in iter_parsed_chunks(self.input_file, self.workers):
+            self.bytes_read += bytes_read
+            for log in logs:
+                if log['Opener_prompt'] not in self.prompt_index:
+                    self.prompt_index[log['Opener_prompt']] = len(self.prompt_index) + 1
+                test_case = log['text']
+                # if test_case is empty, replace it with a space
+                test_case = " " if not test_case else test_case
+                case_number = case_index.get(test_case)
+                if case_number is None:
+                    self.test_cases.append(test_case)
+                    case_number = case_index[test_case] = len(self.test_cases)
+                run.append((case_number, self.lines,
+                            self.prompt_index[log['Opener_prompt']], log['response']))
+                self.lines += 1
+                if len(run) >= self.run_size:
+                    self._write_run(run)
+                    run = []
+        if run:
+            self._write_run(run)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._run_dir.cleanup()
+
+    def _write_run(self, run):
+        """ Sorts a run of entries by test case and writes it to disk. """
+        run.sort()
+        path = os.path.join(self._run_dir.name, f"run{len(self._run_files)}.jsonl")
+        with open(path, 'w') as run_f:
+            for entry in run:
+                run_f.write(json.dumps(entry) + "\n")
+        self._run_files.append(path)
+
+    def _read_run(self, path):
+        """ Reads back a sorted run of entries. """
+        with open(path, 'r') as run_f:
+            for line in run_f:
+                yield json.loads(line)
+
+    def case_groups(self):
+        """ Yields (case number, test case, responses) in case order. """
+        entries = heapq.merge(*(self._read_run(path) for path in self._run_files))
+        for case_number, group in groupby(entries, key=lambda entry: entry[0]):
+            responses = [(prompt_number, response)
+                         for _, _, prompt_number, response in group]
+            yield case_number, self.test_cases[case_number - 1], responses
+
+
+def iter_html_parts(prompt_index, test_cases, case_groups, summary_html=""):
+    """
+    Yields the HTML page piece by piece.
+
+    `test_cases` lists the test cases in order of their numbers, and
+    `case_groups` yields a (case number, test case, responses) tuple per
+    test case, where responses are (prompt number, response) pairs.
+    `summary_html` is shown above the test cases.
+    """
     # Starting the HTML content
-    html_content = """
+    yield """
 <!DOCTYPE html>
 <html>
 
@@ -159,11 +388,11 @@ def generate_html_content(prompt_index, logs_by_test_case):
 
     # Adding prompts to the dropdown
     for prompt, index in prompt_index.items():
-        html_content += f"<a id='prompt{index}' class='dropdown-item prompt-item' role='Prompt' \
+        yield f"<a id='prompt{index}' class='dropdown-item prompt-item' role='Prompt' \
             data-bs-toggle='popover' data-bs-container='body' data-bs-placement='left' \
             data-bs-content='{html.escape(prompt)}' href='#'>Prompt {index}</a>\n"
     # Continuing with the test cases dropdown
-    html_content += """
+    yield """
                             </div>
                         </li>
 
@@ -192,12 +421,12 @@ def generate_html_content(prompt_index, logs_by_test_case):
     """
 
     # Adding test cases to the dropdown
-    for i, test_case in enumerate(logs_by_test_case.keys()):
-        html_content += f"<a id='case{i+1}' class='dropdown-item case-item' role='Case' \
+    for i, test_case in enumerate(test_cases):
+        yield f"<a id='case{i+1}' class='dropdown-item case-item' role='Case' \
             data-bs-toggle='popover' data-bs-container='body' data-bs-placement='left' \
             data-bs-content='{html.escape(test_case)}' href='#'>Test Case {i+1}</a>\n"
     # Closing the dropdowns and starting the main content area
-    html_content += """
+    yield """
                             </div>
                         </li>
 
@@ -214,19 +443,20 @@ def generate_html_content(prompt_index, logs_by_test_case):
         </div>
     </nav>
     <div class="container mt-4">
-        <div id="testCasesContent">
+"""
+    yield summary_html
+    yield """        <div id="testCasesContent">
     """
 
     # Adding content for each test case
-    for i, (test_case, logs) in enumerate(logs_by_test_case.items()):
-        html_content += f"<div class='test-case' data-case-id='case{i+1}'><h3>Test Case {i+1}: {test_case}</h3>\n"
-        for log in logs:
-            prompt_number = prompt_index[log['Opener_prompt']]
-            html_content += f"<p class='case-response' data-prompt-id='prompt{prompt_number}'>Prompt {prompt_number}: {log['response']}</p>\n"
-        html_content += "</div>\n"
+    for case_number, test_case, responses in case_groups:
+        yield f"<div class='test-case' data-case-id='case{case_number}'><h3>Test Case {case_number}: {test_case}</h3>\n"
+        for prompt_number, response in responses:
+            yield f"<p class='case-response' data-prompt-id='prompt{prompt_number}'>Prompt {prompt_number}: {response}</p>\n"
+        yield "</div>\n"
 
     # Closing the HTML tags
-    html_content += """
+    yield """
         </div>
     </div>
     <!-- Bootstrap JS -->
@@ -262,16 +492,349 @@ def generate_html_content(prompt_index, logs_by_test_case):
 
 </html>
     """
-    return html_content
 
 
-def transform_log_to_html(input_file, output_file):
-    """ Main function to transform log data into an HTML file. """
-    prompt_index, logs_by_test_case = organize_logs(input_file)
+SHARDED_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+
+<head>
+    <title>Chat Opener Evaluation</title>
+    <!-- Bootstrap CSS -->
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.0/dist/css/bootstrap.min.css" rel="stylesheet">
+    <style>
+        .scrollable-menu {
+            height: auto;
+            max-height: 300px;
+            overflow-x: hidden;
+            overflow-y: auto;
+        }
+
+        .shard {
+            min-height: 400px;
+        }
+
+        .item-inactive {
+            color: #adb5bd;
+            text-decoration: line-through;
+        }
+    </style>
+</head>
+
+<body>
+    <nav class="navbar navbar-expand-lg navbar-light bg-light sticky-top">
+        <div class="container-fluid">
+            <a class="navbar-brand" href="#">Chat Opener Evaluation</a>
+            <ul class="navbar-nav">
+                <!-- Dropdown for Prompts -->
+                <li class="nav-item dropdown">
+                    <a class="nav-link dropdown-toggle" href="#" id="navbarDropdownPrompts" role="button"
+                        data-bs-toggle="dropdown" data-bs-auto-close="outside" aria-expanded="false">
+                        Prompts
+                    </a>
+                    <ul id="promptMenu" class="dropdown-menu scrollable-menu" aria-labelledby="navbarDropdownPrompts">
+                    </ul>
+                </li>
+                <!-- Dropdown for Test Cases -->
+                <li class="nav-item dropdown">
+                    <a class="nav-link dropdown-toggle" href="#" id="navbarDropdownTestCases" role="button"
+                        data-bs-toggle="dropdown" data-bs-auto-close="outside" aria-expanded="false">
+                        Test Cases
+                    </a>
+                    <ul id="caseMenu" class="dropdown-menu dropdown-menu-end scrollable-menu" aria-labelledby="navbarDropdownTestCases">
+                    </ul>
+                </li>
+            </ul>
+        </div>
+    </nav>
+    <div class="container mt-4">__SUMMARY__
+        <div id="testCasesContent">
+        </div>
+    </div>
+    <!-- Bootstrap JS -->
+    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.0/dist/js/bootstrap.bundle.min.js"></script>
+    <script id="reportIndex" type="application/json">__REPORT_INDEX__</script>
+    <script>
+        var reportIndex = JSON.parse(document.getElementById('reportIndex').textContent);
+        var activePrompts = new Set(reportIndex.prompts.map(function (prompt) { return prompt.number; }));
+        var activeCases = new Set(reportIndex.cases.map(function (testCase) { return testCase.number; }));
+        var shardData = {};
+        var shardElements = [];
+
+        function buildMenu(menuId, items, label, activeSet) {
+            var fragment = document.createDocumentFragment();
+            items.forEach(function (item) {
+                var link = document.createElement('a');
+                link.className = 'dropdown-item';
+                link.href = '#';
+                link.title = item.text;
+                link.textContent = label + ' ' + item.number;
+                link.addEventListener('click', function (event) {
+                    event.preventDefault();
+                    // Toggle the item between active and inactive
+                    if (activeSet.has(item.number)) {
+                        activeSet.delete(item.number);
+                    } else {
+                        activeSet.add(item.number);
+                    }
+                    link.classList.toggle('item-inactive', !activeSet.has(item.number));
+                    showActive();
+                });
+                var listItem = document.createElement('li');
+                listItem.appendChild(link);
+                fragment.appendChild(listItem);
+            });
+            document.getElementById(menuId).appendChild(fragment);
+        }
+
+        function shardHasActiveCase(shard) {
+            var info = reportIndex.shards[shard];
+            for (var number = info.first; number <= info.last; number++) {
+                if (activeCases.has(number)) {
+                    return true;
+                }
+            }
+            return false;
+        }
+
+        function renderShard(shard) {
+            var data = shardData[shard];
+            var element = shardElements[shard];
+            if (!data) {
+                return;
+            }
+            var fragment = document.createDocumentFragment();
+            data.cases.forEach(function (testCase) {
+                if (!activeCases.has(testCase.number)) {
+                    return;
+                }
+                var caseElement = document.createElement('div');
+                caseElement.className = 'test-case';
+                var heading = document.createElement('h3');
+                heading.textContent = 'Test Case ' + testCase.number + ': ' + testCase.text;
+                caseElement.appendChild(heading);
+                testCase.responses.forEach(function (response) {
+                    if (!activePrompts.has(response[0])) {
+                        return;
+                    }
+                    var paragraph = document.createElement('p');
+                    paragraph.className = 'case-response';
+                    paragraph.textContent = 'Prompt ' + response[0] + ': ' + response[1];
+                    caseElement.appendChild(paragraph);
+                });
+                fragment.appendChild(caseElement);
+            });
+            element.textContent = '';
+            element.appendChild(fragment);
+            element.classList.remove('shard');
+        }
+
+        function loadShard(shard) {
+            if (shard in shardData) {
+                return;
+            }
+            shardData[shard] = null;
+            fetch(reportIndex.shards[shard].file)
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    shardData[shard] = data;
+                    renderShard(shard);
+                })
+                .catch(function (error) {
+                    shardElements[shard].textContent = 'Could not load ' + reportIndex.shards[shard].file + ': ' + error;
+                });
+        }
+
+        function showActive() {
+            shardElements.forEach(function (element, shard) {
+                element.hidden = !shardHasActiveCase(shard);
+                renderShard(shard);
+            });
+        }
+
+        document.addEventListener("DOMContentLoaded", function () {
+            buildMenu('promptMenu', reportIndex.prompts, 'Prompt', activePrompts);
+            buildMenu('caseMenu', reportIndex.cases, 'Test Case', activeCases);
+
+            // One placeholder per shard, loaded when it comes close to the viewport
+            var observer = new IntersectionObserver(function (entries) {
+                entries.forEach(function (entry) {
+                    if (entry.isIntersecting) {
+                        loadShard(Number(entry.target.dataset.shard));
+                    }
+                });
+            }, { rootMargin: '1500px 0px' });
+            var content = document.getElementById('testCasesContent');
+            reportIndex.shards.forEach(function (info, shard) {
+                var element = document.createElement('div');
+                element.className = 'shard';
+                element.dataset.shard = shard;
+                shardElements.push(element);
+                content.appendChild(element);
+                observer.observe(element);
+            });
+        });
+    </script>
+</body>
+
+</html>
+"""
+
+
+def generate_html_content(prompt_index, logs_by_test_case, summary_html=""):
+    """ Generates HTML content from categorized logs. """
+    case_groups = (
+        (i + 1, test_case,
+         [(prompt_index[log['Opener_prompt']], log['response'])
+          for log in logs])
+        for i, (test_case, logs) in enumerate(logs_by_test_case.items()))
+    return "".join(iter_html_parts(
+        prompt_index, logs_by_test_case.keys(), case_groups, summary_html))
+
+
+def write_sharded_report(prompt_index, test_cases, case_groups, output_file,
+                         shard_size=500, summary_html=""):
+    """
+    Writes an index page and JSON shards of shard_size test cases each.
+
+    The shards are written to a "<output name>_data" folder next to the
+    page, and the page embeds an index of the prompts, test cases and
+    shards. Returns the number of shards written.
+    """
+    shards = []
+    case_groups = iter(case_groups)
+    while True:
+        groups = list(islice(case_groups, shard_size))
+        if not groups:
+            break
+        shards.append(write_shard(output_file, len(shards) + 1, groups))
+
+    write_report_index(output_file, prompt_index, test_cases, shards, summary_html)
+    return len(shards)
+
+
+def shard_location(output_file, shard_number):
+    """ Returns the shard's path on disk and its URL relative to the page. """
+    data_dir_name = os.path.splitext(os.path.basename(output_file))[0] + "_data"
+    shard_name = f"shard{shard_number:05d}.json"
+    path = os.path.join(os.path.dirname(output_file), data_dir_name, shard_name)
+    return path, urllib.parse.quote(f"{data_dir_name}/{shard_name}")
+
+
+def write_shard(output_file, shard_number, groups):
+    """ Writes one shard of (case number, test case, responses) groups and returns its index entry. """
+    path, url = shard_location(output_file, shard_number)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    cases = [{"number": case_number, "text": test_case, "responses": responses}
+             for case_number, test_case, responses in groups]
+    with open(path, 'w') as shard_f:
+        json.dump({"cases": cases}, shard_f)
+    return {"file": url, "first": cases[0]["number"], "last": cases[-1]["number"]}
+
+
+def write_report_index(output_file, prompt_index, test_cases, shards, summary_html=""):
+    """ Writes the index page of a sharded report, with summary_html above the test cases. """
+    report_index = {
+        "prompts": [{"number": index, "text": prompt}
+                    for prompt, index in prompt_index.items()],
+        "cases": [{"number": i + 1, "text": test_case}
+                  for i, test_case in enumerate(test_cases)],
+        "shards": shards,
+    }
+    # Keep the embedded JSON from closing the script element
+    index_json = json.dumps(report_index).replace("</", "<\\/")
+    head, _, tail = SHARDED_PAGE_TEMPLATE.partition("__SUMMARY__")
+    with open(output_file, 'w') as output_f:
+        output_f.write(head + summary_html + tail.replace("__REPORT_INDEX__", index_json))
+
+
+def transform_log_to_html(input_file, output_file, streaming=False,
+                          run_size=100000, shard_size=None, workers=1,
+                          diversity=False):
+    """
+    Main function to transform log data into an HTML file.
+
+    With streaming=True the logs are grouped through ExternalLogGrouping
+    and the page is written as it is generated, and a dict with the number
+    of lines, the throughput and the peak memory of the process is
+    returned (see _peak_memory_mb). With a
+    shard_size the output is a lazily loading index page plus JSON shards,
+    see write_sharded_report; the logs are then always streamed.
+    input_file may be a list of files or a glob pattern, which are parsed
+    by the given number of worker processes.
+    With diversity=True the report starts with the diversity metrics and
+    near-duplicate clusters of the responses, see diversity.py, which are
+    also returned (in the "diversity" key of the dict when streaming).
+    """
+    if streaming or shard_size:
+        return _stream_log_to_html(input_file, output_file, run_size,
+                                   shard_size, workers, diversity)
+
+    prompt_index, logs_by_test_case = organize_logs(input_file, workers)
+
+    summary_html = ""
+    metrics = None
+    if diversity:
+        # Requires NumPy, so only imported when asked for
+        from diversity import analyze_logs, diversity_html
+        metrics = analyze_logs(prompt_index, logs_by_test_case)
+        summary_html = diversity_html(metrics)
 
     # Starting the HTML content
-    html_content = generate_html_content(prompt_index, logs_by_test_case)
+    html_content = generate_html_content(prompt_index, logs_by_test_case, summary_html)
 
     # Writing the HTML content to the output file
     with open(output_file, 'w') as output_f:
         output_f.write(html_content)
+    return metrics
+
+
+def _stream_log_to_html(input_file, output_file, run_size, shard_size,
+                        workers=1, diversity=False):
+    """ Transforms log data into HTML with bounded memory. """
+    start = time.perf_counter()
+    shards = None
+    metrics = None
+    summary_html = ""
+    with ExternalLogGrouping(input_file, run_size, workers=workers) as grouping:
+        if diversity:
+            # Requires NumPy, so only imported when asked for
+            from diversity import analyze_case_groups, diversity_html
+            metrics = analyze_case_groups(grouping.case_groups())
+            summary_html = diversity_html(metrics)
+        if shard_size:
+            shards = write_sharded_report(
+                grouping.prompt_index, grouping.test_cases,
+                grouping.case_groups(), output_file, shard_size, summary_html)
+        else:
+            with open(output_file, 'w') as output_f:
+                for part in iter_html_parts(grouping.prompt_index,
+                                            grouping.test_cases,
+                                            grouping.case_groups(),
+                                            summary_html):
+                    output_f.write(part)
+    seconds = time.perf_counter() - start
+    return {
+        "lines": grouping.lines,
+        "shards": shards,
+        "seconds": seconds,
+        "lines_per_second": grouping.lines / seconds if seconds else 0.0,
+        "mb_per_second": grouping.bytes_read / 1e6 / seconds if seconds else 0.0,
+        "peak_memory_mb": _peak_memory_mb(),
+        "diversity": metrics,
+    }
+
+
+def _peak_memory_mb():
+    """
+    Returns the peak resident memory of the process in megabytes.
+
+    This is the peak since the process started, so it includes anything
+    the caller allocated before the conversion, and it excludes the worker
+    processes. It is not measured with tracemalloc, which would slow the
+    conversion down and skew the reported throughput.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
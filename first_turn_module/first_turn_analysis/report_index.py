@@ -0,0 +1,233 @@
+"""
+This script keeps sharded HTML reports up to date as logs grow.
+
+Instead of re-parsing every log after each prompt experiment, the logs
+are ingested into a SQLite index that remembers how far each file has
+been read, which number every prompt and test case was given, and the
+responses of each test case. A later run reads only the lines appended
+since, and rewrites only the shards holding test cases that received new
+responses, plus the small index page.
+
+Prompt and test case numbers are assigned once, in order of first
+appearance, and never change, so links into the report stay valid.
+
+Functions:
+- update_report: Ingests new log lines and regenerates the affected
+    parts of a sharded report.
+- ReportIndex: The on-disk index of ingested logs.
+
+Usage:
+The logs are expected to be append-only. A file that became shorter than
+the indexed offset raises an error; delete the index to rebuild it.
+"""
+
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from itertools import groupby
+
+from compact_log import CompactLog, is_compact_log
+from log2html_converter import (expand_inputs, json_loads, write_report_index,
+                                write_shard, shard_location)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, offset INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS prompts (number INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS cases (number INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS responses (
+    seq INTEGER PRIMARY KEY,
+    case_number INTEGER NOT NULL,
+    prompt_number INTEGER NOT NULL,
+    response TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_case ON responses (case_number, seq);
+CREATE TABLE IF NOT EXISTS dirty_cases (number INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class ReportIndex:
+    """
+    SQLite index of ingested log lines.
+
+    Test cases that received responses since the report was last written
+    are kept in the dirty_cases table, so an interrupted run regenerates
+    them the next time.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, input_file):
+        """ Reads the lines appended to the log files since the last call and returns their number. """
+        lines = 0
+        prompt_numbers = {}
+        case_numbers = {}
+        with self.connection:
+            for path in expand_inputs(input_file):
+                lines += self._ingest_file(path, prompt_numbers, case_numbers)
+        return lines
+
+    def _ingest_file(self, path, prompt_numbers, case_numbers):
+        """ Ingests the complete lines of one file past its indexed offset, or a whole new compact log. """
+        path = os.path.abspath(path)
+        row = self.connection.execute(
+            "SELECT offset FROM files WHERE path = ?", (path,)).fetchone()
+        offset = row[0] if row else 0
+        if os.path.getsize(path) < offset:
+            raise ValueError(f"{path} is shorter than when it was indexed, delete the index to rebuild it")
+
+        if is_compact_log(path):
+            # Compact logs are written once, so they are ingested whole
+            logs = []
+            if offset == 0:
+                with CompactLog(path) as compact_log:
+                    logs = list(compact_log)
+                offset = os.path.getsize(path)
+        else:
+            logs, offset = self._read_new_lines(path, offset)
+
+        for log in logs:
+            prompt_number = self._number("prompts", log['Opener_prompt'], prompt_numbers)
+            # if test_case is empty, replace it with a space
+            test_case = log['text'] if log['text'] else " "
+            case_number = self._number("cases", test_case, case_numbers)
+            self.connection.execute(
+                "INSERT INTO responses (case_number, prompt_number, response) VALUES (?, ?, ?)",
+                (case_number, prompt_number, log['response']))
+            self.connection.execute(
+                "INSERT OR IGNORE INTO dirty_cases (number) VALUES (?)", (case_number,))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (path, offset) VALUES (?, ?)", (path, offset))
+        return len(logs)
+
+    @staticmethod
+    def _read_new_lines(path, offset):
+        """ Parses the complete lines of a JSON Lines log past the offset and returns them with the new offset. """
+        logs = []
+        with open(path, 'rb') as input_f:
+            input_f.seek(offset)
+            for line in input_f:
+                if not line.endswith(b"\n"):
+                    # The line is still being written, pick it up next time
+                    break
+                offset += len(line)
+                if line.strip():
+                    logs.append(json_loads(line))
+        return logs, offset
+
+    def _number(self, table, text, numbers):
+        """ Returns the number of a prompt or test case, assigning the next one if it is new. """
+        number = numbers.get(text)
+        if number is None:
+            row = self.connection.execute(
+                f"SELECT number FROM {table} WHERE text = ?", (text,)).fetchone()
+            if row:
+                number = row[0]
+            else:
+                number = self.connection.execute(
+                    f"INSERT INTO {table} (text) VALUES (?)", (text,)).lastrowid
+            numbers[text] = number
+        return number
+
+    def prompt_index(self):
+        """ Returns the prompts mapped to their numbers, in number order. """
+        return OrderedDict(self.connection.execute(
+            "SELECT text, number FROM prompts ORDER BY number"))
+
+    def test_cases(self):
+        """ Returns the test cases in order of their numbers. """
+        return [text for text, in self.connection.execute(
+            "SELECT text FROM cases ORDER BY number")]
+
+    def dirty_cases(self):
+        """ Returns the numbers of the test cases not yet written to the report. """
+        return [number for number, in self.connection.execute(
+            "SELECT number FROM dirty_cases ORDER BY number")]
+
+    def clear_dirty_cases(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM dirty_cases")
+
+    def case_groups(self, first, last):
+        """ Yields (case number, test case, responses) for the test cases first to last. """
+        rows = self.connection.execute(
+            "SELECT r.case_number, c.text, r.prompt_number, r.response"
+            " FROM responses r JOIN cases c ON c.number = r.case_number"
+            " WHERE r.case_number BETWEEN ? AND ? ORDER BY r.case_number, r.seq",
+            (first, last))
+        for (case_number, test_case), group in groupby(rows, key=lambda row: row[:2]):
+            yield case_number, test_case, [(prompt_number, response)
+                                           for _, _, prompt_number, response in group]
+
+    def get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def update_report(index_path, input_file, output_file, shard_size=500):
+    """
+    Ingests new log lines into the index and updates a sharded report.
+
+    Shard n holds the test cases numbered (n - 1) * shard_size + 1 to
+    n * shard_size. Only the shards with new responses are rewritten,
+    unless the output file or shard size changed since the last run, in
+    which case every shard is. Returns a dict with the number of lines
+    ingested, the shards written and in total, and the time taken.
+    """
+    start = time.perf_counter()
+    with ReportIndex(index_path) as index:
+        lines = index.ingest(input_file)
+
+        test_cases = index.test_cases()
+        total_shards = -(-len(test_cases) // shard_size)
+        full_rebuild = (index.get_meta("output_file") != os.path.abspath(output_file)
+                        or index.get_meta("shard_size") != str(shard_size)
+                        or not os.path.exists(output_file))
+        if full_rebuild:
+            affected = range(1, total_shards + 1)
+        else:
+            affected = sorted({(number - 1) // shard_size + 1
+                               for number in index.dirty_cases()})
+
+        for shard_number in affected:
+            first = (shard_number - 1) * shard_size + 1
+            write_shard(output_file, shard_number,
+                        index.case_groups(first, first + shard_size - 1))
+
+        shards = []
+        for shard_number in range(1, total_shards + 1):
+            first = (shard_number - 1) * shard_size + 1
+            shards.append({
+                "file": shard_location(output_file, shard_number)[1],
+                "first": first,
+                "last": min(first + shard_size - 1, len(test_cases)),
+            })
+        write_report_index(output_file, index.prompt_index(), test_cases, shards)
+
+        index.set_meta("output_file", os.path.abspath(output_file))
+        index.set_meta("shard_size", shard_size)
+        index.clear_dirty_cases()
+
+    return {
+        "lines": lines,
+        "shards_written": len(affected),
+        "shards": total_shards,
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,116 @@
+"""Adaptive generation budget for the first turn module.
+
+Openers are cut at the `###` delimiter, so most of a fixed 64-token
+generation budget is decoded only to be discarded. `AdaptiveTokenBudget`
+learns from the recent openers how many tokens cover a target percentile
+of their kept lengths and requests only that many, with some headroom.
+It also counts the tokens generated and kept, which shows the
+decode-time savings.
+"""
+
+import math
+import threading
+from collections import deque
+
+
+class AdaptiveTokenBudget:
+    """
+    Thread-safe online estimate of the max_new_tokens openers need.
+
+    The budget is the `target_percentile` of the kept token counts of the
+    last `window` openers, times `headroom`, within `min_tokens` and the
+    caller's maximum. Until `warmup` openers were observed, the caller's
+    maximum is used. An opener that was cut short by the budget is counted
+    as needing the full budget, which the headroom then grows again. The
+    caller decides what counts as cut short: token estimates can be lower
+    than the model's own counts, so comparing them with the budget would
+    miss truncated openers and let the budget shrink without bound.
+
+    Args:
+        target_percentile (float): Percentage of openers the budget should
+                                   cover completely.
+        headroom (float): Factor applied to the percentile.
+        min_tokens (int): Lower bound of the budget.
+        window (int): Number of recent openers learned from.
+        warmup (int): Openers observed before the budget adapts.
+    """
+
+    def __init__(self, target_percentile=95.0, headroom=1.2, min_tokens=8,
+                 window=1000, warmup=50):
+        self.target_percentile = target_percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.warmup = warmup
+        self._needed = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._budget = None
+        self.requests = 0
+        self.truncated = 0
+        self.tokens_budgeted = 0
+        self.tokens_generated = 0
+        self.tokens_kept = 0
+
+    def budget(self, max_tokens):
+        """
+        Return the number of tokens to request.
+
+        Args:
+            max_tokens (int): The caller's max_new_tokens, an upper bound.
+
+        Returns:
+            int: The adaptive budget, or max_tokens while warming up.
+        """
+        budget = self._budget
+        if budget is None:
+            return max_tokens
+        return max(self.min_tokens, min(budget, max_tokens))
+
+    def observe(self, budget, generated, kept, truncated):
+        """
+        Learn from a finished generation.
+
+        Args:
+            budget (int): The max_new_tokens the generation was run with.
+            generated (int): Tokens the model generated.
+            kept (int): Tokens left after filtering.
+            truncated (bool): Whether the generation ended because it used
+                              up the budget.
+        """
+        with self._lock:
+            self.requests += 1
+            self.truncated += truncated
+            self.tokens_budgeted += budget
+            self.tokens_generated += generated
+            self.tokens_kept += kept
+            self._needed.append(budget if truncated else kept)
+            if len(self._needed) >= self.warmup:
+                self._budget = math.ceil(
+                    _percentile(self._needed, self.target_percentile)
+                    * self.headroom)
+
+    def stats(self):
+        """
+        Return the budget and token counters.
+
+        Returns:
+            dict: Requests, truncated generations, the current budget, and
+                  the tokens budgeted, generated and kept in total.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "truncated": self.truncated,
+                "budget": self._budget,
+                "tokens_budgeted": self.tokens_budgeted,
+                "tokens_generated": self.tokens_generated,
+                "tokens_kept": self.tokens_kept,
+                "kept_ratio": (self.tokens_kept / self.tokens_generated
+                               if self.tokens_generated else 0.0),
+            }
+
+
+def _percentile(values, q):
+    """Return the nearest-rank q-th percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
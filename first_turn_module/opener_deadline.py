@@ -0,0 +1,220 @@
+"""Latency-budget helpers for the GauchoChat first turn module.
+
+A slow model worker should not hold up a user's first turn. The helpers in
+this module run a blocking or asynchronous request against a deadline,
+optionally hedging it with a duplicate request to a second worker, and
+count which path each opener ended up taking so the budget can be tuned
+against the latency SLO.
+"""
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when no request succeeded within the latency budget."""
+
+
+def call_with_deadline(executor, request_fn, budget, hedge_fn=None,
+                       hedge_delay=None):
+    """
+    Run a request, returning its result only if it arrives within budget.
+
+    If `hedge_fn` is given it is started once `hedge_delay` seconds have
+    passed without a result, or right away if the first request fails, and
+    whichever request succeeds first wins. Each request is called with a
+    `timeout` keyword argument holding the seconds left until the deadline
+    when it starts, so it can give up in time. Once a result is returned or
+    the budget is exhausted, requests that have not started are cancelled;
+    requests still running are left to finish within their timeout, and
+    their results are discarded.
+
+    Args:
+        executor (Executor): Executor used to run the requests.
+        request_fn (callable): The primary request.
+        budget (float): Total time in seconds to wait for a result.
+        hedge_fn (callable, optional): The duplicate request.
+        hedge_delay (float, optional): Seconds to wait before hedging.
+                                       Defaults to half of the budget.
+
+    Returns:
+        tuple: The result and "primary" or "hedge", naming the request that
+               produced it.
+
+    Raises:
+        DeadlineExceeded: If no request succeeded within the budget.
+        Exception: The last error if every request failed before the
+                   deadline.
+    """
+    start = time.monotonic()
+    deadline = start + budget
+    hedge_at = None
+    if hedge_fn is not None:
+        hedge_at = start + (budget / 2 if hedge_delay is None else hedge_delay)
+
+    labels = {executor.submit(_call_before, request_fn, deadline): "primary"}
+    pending = set(labels)
+    error = None
+    try:
+        while True:
+            now = time.monotonic()
+            if hedge_at is not None and (now >= hedge_at or not pending):
+                future = executor.submit(_call_before, hedge_fn, deadline)
+                labels[future] = "hedge"
+                pending.add(future)
+                hedge_at = None
+            if not pending:
+                raise error
+            if now >= deadline:
+                raise DeadlineExceeded(f"no opener within {budget:.3f}s")
+
+            wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=wake_at - now,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result(), labels[future]
+                error = future.exception()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def acall_with_deadline(request_fn, budget, hedge_fn=None,
+                              hedge_delay=None):
+    """
+    The asyncio counterpart of `call_with_deadline`.
+
+    The requests are coroutine functions, called with the same `timeout`
+    keyword argument. Requests still running once a result is returned or
+    the budget is exhausted are cancelled.
+
+    Args:
+        request_fn (callable): The primary request.
+        budget (float): Total time in seconds to wait for a result.
+        hedge_fn (callable, optional): The duplicate request.
+        hedge_delay (float, optional): Seconds to wait before hedging.
+                                       Defaults to half of the budget.
+
+    Returns:
+        tuple: The result and "primary" or "hedge", naming the request that
+               produced it.
+
+    Raises:
+        DeadlineExceeded: If no request succeeded within the budget.
+        Exception: The last error if every request failed before the
+                   deadline.
+    """
+    # Deferred, since only asyncio applications need it
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + budget
+    hedge_at = None
+    if hedge_fn is not None:
+        hedge_at = start + (budget / 2 if hedge_delay is None else hedge_delay)
+
+    labels = {asyncio.ensure_future(
+        _acall_before(request_fn, deadline, loop)): "primary"}
+    pending = set(labels)
+    error = None
+    try:
+        while True:
+            now = loop.time()
+            if hedge_at is not None and (now >= hedge_at or not pending):
+                task = asyncio.ensure_future(
+                    _acall_before(hedge_fn, deadline, loop))
+                labels[task] = "hedge"
+                pending.add(task)
+                hedge_at = None
+            if not pending:
+                raise error
+            if now >= deadline:
+                raise DeadlineExceeded(f"no opener within {budget:.3f}s")
+
+            wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = await asyncio.wait(
+                pending, timeout=wake_at - now,
+                return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), labels[task]
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+            # Retrieve a late error, so asyncio does not report it unhandled
+            task.add_done_callback(
+                lambda task: task.cancelled() or task.exception())
+
+
+def _call_before(request_fn, deadline):
+    """Call a request with the time left, unless the deadline has passed."""
+    timeout = deadline - time.monotonic()
+    if timeout <= 0:
+        raise DeadlineExceeded("the deadline passed before the request ran")
+    try:
+        return request_fn(timeout=timeout)
+    except Exception as e:
+        if time.monotonic() >= deadline:
+            # Most likely the request timed out at the deadline.
+            raise DeadlineExceeded(f"request failed at the deadline: {e}") \
+                from e
+        raise
+
+
+async def _acall_before(request_fn, deadline, loop):
+    """The asyncio counterpart of `_call_before`."""
+    timeout = deadline - loop.time()
+    if timeout <= 0:
+        raise DeadlineExceeded("the deadline passed before the request ran")
+    try:
+        return await request_fn(timeout=timeout)
+    except Exception as e:
+        if loop.time() >= deadline:
+            # Most likely the request timed out at the deadline.
+            raise DeadlineExceeded(f"request failed at the deadline: {e}") \
+                from e
+        raise
+
+
+class PathCounters:
+    """
+    Thread-safe counters of the path each opener request took.
+
+    Typical paths are "model", "hedge", "pool", "deadline_pool",
+    "deadline_fallback", "error_pool", "error_fallback" and
+    "pool_refill".
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, path):
+        """
+        Count one request that took the given path.
+
+        Args:
+            path (str): The name of the path.
+        """
+        with self._lock:
+            self._counts[path] += 1
+
+    def snapshot(self):
+        """
+        Return the current counts.
+
+        Returns:
+            dict: Mapping of path name to number of requests.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        """Reset every counter to zero."""
+        with self._lock:
+            self._counts.clear()
@@ -0,0 +1,104 @@
+"""Asynchronous dispatch of opener requests for the GauchoChat first turn module.
+
+Conversation openers are requested by many sessions at once, and each
+synchronous request keeps a worker thread blocked for the whole model
+latency. The `OpenerDispatcher` in this module lets asyncio callers await
+their opener requests instead. With an asynchronous request function the
+requests wait on the event loop, so their number is only bounded by the
+connections the model worker accepts; a blocking one runs on a small,
+bounded thread pool, which caps throughput at the number of threads per
+model latency.
+
+Requests are sent as soon as they are submitted. FastChat workers take
+one prompt per request, so holding requests back to group them would
+only add latency.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OpenerDispatcher:
+    """
+    Send opener requests from asyncio code without blocking the event loop.
+
+    Args:
+        request_fn (callable): Function or coroutine function with the
+                               signature of `make_request_to_vicuna_model`
+                               and an optional `timeout` keyword argument,
+                               used to request a single prompt.
+        max_concurrency (int): Number of threads available for blocking
+                               model requests.
+    """
+
+    def __init__(self, request_fn, max_concurrency=32):
+        self._request_fn = request_fn
+        self._is_async = asyncio.iscoroutinefunction(request_fn)
+        self._max_concurrency = max_concurrency
+        self._executor = None
+        self.requests_sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def submit(self, prompt, stop_token, controller_address,
+                     worker_address, model_name, max_new_tokens,
+                     timeout=None):
+        """
+        Send a prompt to the model and wait for its response.
+
+        Args:
+            prompt (str): The prompt to send to the model.
+            stop_token (str or tuple): The stop token(s) for the generation.
+            controller_address (str): The address of the controller.
+            worker_address (str, optional): The address of the worker.
+            model_name (str): The name of the model to be used.
+            max_new_tokens (int): The maximum number of new tokens.
+            timeout (float, optional): Seconds the generation may take.
+
+        Returns:
+            str: The raw response of the model for this prompt.
+
+        Raises:
+            Exception: Whatever the model request raised for this prompt.
+        """
+        request = functools.partial(
+            self._request_fn, prompt, stop_token, controller_address,
+            worker_address, model_name, max_new_tokens, timeout=timeout)
+        self.requests_sent += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self._is_async:
+                return await request()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), request)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        """
+        Return counters describing the requests sent.
+
+        Returns:
+            dict: Number of requests sent, in flight and the most that were
+                  in flight at once.
+        """
+        return {
+            "requests_sent": self.requests_sent,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
+
+    def close(self):
+        """Release the threads used for model requests."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _get_executor(self):
+        """Return the thread pool, creating it on first use."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_concurrency,
+                thread_name_prefix="opener-dispatch")
+        return self._executor
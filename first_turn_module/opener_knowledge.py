@@ -0,0 +1,169 @@
+"""Token-budgeted packing of external knowledge into the opener prompt.
+
+The topical knowledge attached to a user can be much longer than what is
+useful for one opener, and every extra token adds prefill time. This
+module splits the knowledge into snippets, ranks them by their relevance
+to the recent conversation, and keeps the best ones that fit into a token
+budget, in their original order. Knowledge that fits the budget is
+passed through unchanged, as the same string object, so that the
+prompt-prefix cache recognises it without hashing it again.
+"""
+
+import functools
+import math
+import re
+import threading
+from collections import Counter, namedtuple
+
+from .opener_tokenizer import count_tokens
+
+
+PackedKnowledge = namedtuple(
+    "PackedKnowledge",
+    ["text", "tokens_used", "tokens_dropped", "snippets_used",
+     "snippets_dropped"])
+PackedKnowledge.__doc__ = """
+Knowledge packed into a token budget.
+
+Attributes:
+    text (str): The kept snippets in their original order, separated as in
+                the knowledge, or the knowledge itself if nothing was
+                dropped.
+    tokens_used (int): Tokens of the kept snippets.
+    tokens_dropped (int): Tokens of the snippets left out.
+    snippets_used (int): Number of kept snippets.
+    snippets_dropped (int): Number of snippets left out.
+"""
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_SNIPPET_RE = re.compile(r"\n\s*\n|\n|(?<=[.!?])\s+")
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def pack_knowledge(knowledge, history, token_budget, recent_turns=3):
+    """
+    Keep the knowledge snippets most relevant to the history within a budget.
+
+    Snippets are scored by the words they share with the last
+    `recent_turns` turns, weighted by how rare each word is among the
+    snippets. Without any overlap the original order decides. The best
+    snippets are then added greedily as long as they fit.
+
+    Args:
+        knowledge (str): The external knowledge.
+        history (list): A list of dictionaries containing the history of the
+                        conversation.
+        token_budget (int): Maximum number of knowledge tokens to keep.
+        recent_turns (int): Number of recent turns used for ranking.
+
+    Returns:
+        PackedKnowledge: The packed knowledge and how much was dropped.
+    """
+    snippets = _split_snippets(knowledge)
+    query = set()
+    for turn in history[-recent_turns:]:
+        for key in ("user", "bot"):
+            if turn.get(key):
+                query.update(_WORD_RE.findall(turn[key].lower()))
+
+    document_frequency = Counter()
+    for _, _, words, _ in snippets:
+        document_frequency.update(words & query)
+    n_snippets = len(snippets)
+
+    def score(index):
+        words = snippets[index][2]
+        return sum(math.log(1 + n_snippets / document_frequency[word])
+                   for word in words & query)
+
+    ranked = sorted(range(n_snippets), key=lambda i: (-score(i), i))
+    kept = set()
+    tokens_used = 0
+    for index in ranked:
+        tokens = snippets[index][1]
+        if tokens_used + tokens <= token_budget:
+            kept.add(index)
+            tokens_used += tokens
+
+    total_tokens = sum(tokens for _, tokens, _, _ in snippets)
+    if len(kept) == n_snippets:
+        text = knowledge
+    else:
+        text = _join_snippets(knowledge, tuple(sorted(kept)))
+    packed = PackedKnowledge(
+        text=text,
+        tokens_used=tokens_used,
+        tokens_dropped=total_tokens - tokens_used,
+        snippets_used=len(kept),
+        snippets_dropped=n_snippets - len(kept),
+    )
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["tokens_used"] += packed.tokens_used
+        _stats["tokens_dropped"] += packed.tokens_dropped
+        _stats["snippets_used"] += packed.snippets_used
+        _stats["snippets_dropped"] += packed.snippets_dropped
+    return packed
+
+
+def packing_stats():
+    """
+    Return the totals of every packing since the process started.
+
+    Returns:
+        dict: Number of packings and the tokens and snippets kept and
+              dropped.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+@functools.lru_cache(maxsize=256)
+def _split_snippets(knowledge):
+    """
+    Split knowledge into snippets and measure each of them once.
+
+    Args:
+        knowledge (str): The external knowledge.
+
+    Returns:
+        tuple: A (text, token count, set of words, separator) tuple per
+               snippet, the separator being the text between the previous
+               snippet and this one.
+    """
+    snippets = []
+    start = end = 0
+    for match in [*_SNIPPET_RE.finditer(knowledge), None]:
+        stop = match.start() if match is not None else len(knowledge)
+        segment = knowledge[start:stop]
+        text = segment.strip()
+        if text:
+            text_start = start + len(segment) - len(segment.lstrip())
+            snippets.append((text, count_tokens(text),
+                             frozenset(_WORD_RE.findall(text.lower())),
+                             knowledge[end:text_start]))
+            end = text_start + len(text)
+        if match is not None:
+            start = match.end()
+    return tuple(snippets)
+
+
+@functools.lru_cache(maxsize=256)
+def _join_snippets(knowledge, kept):
+    """
+    Join kept snippets with their original separators.
+
+    Cached, so that the same selection yields the same string object.
+
+    Args:
+        knowledge (str): The external knowledge.
+        kept (tuple): Indices of the kept snippets, in ascending order.
+
+    Returns:
+        str: The kept snippets.
+    """
+    snippets = _split_snippets(knowledge)
+    return "".join(snippets[i][3] + snippets[i][0] if n else snippets[i][0]
+                   for n, i in enumerate(kept))
@@ -0,0 +1,152 @@
+"""Asynchronous, sampled logging of opener prompts and responses.
+
+Writing the full prompt of every opener to the debug log formats and
+writes several kilobytes of text on the request thread. The
+`PromptLogWriter` instead samples records, hands them to a bounded queue,
+and lets a background thread serialize them to a JSON Lines file, one
+object per line with the `Opener_prompt`, `text` and `response` keys read
+by `first_turn_analysis/log2html_converter.py`. When the queue is full
+records are dropped rather than blocking the caller.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+
+
+class PromptLogWriter:
+    """
+    Background JSON Lines writer for opener records.
+
+    Once the log file grows past `max_bytes` it is rotated to a single
+    backup file with the suffix ".1", replacing any earlier backup.
+
+    Args:
+        path (str): The log file to append to.
+        sample_rate (float): Fraction of records to keep, from 0 to 1.
+        max_bytes (int): Size at which the log file is rotated.
+        queue_size (int): Maximum number of records waiting to be written.
+    """
+
+    def __init__(self, path, sample_rate=1.0, max_bytes=256 * 1024 * 1024,
+                 queue_size=10000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._random = random.Random()
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._thread = threading.Thread(
+            target=self._write_loop, name="opener-prompt-log", daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        """
+        Decide whether to keep a record.
+
+        Callers can sample before building an expensive record and then
+        pass it to `write`.
+
+        Returns:
+            bool: Whether the record should be kept.
+        """
+        return self.sample_rate >= 1.0 or self._random.random() < self.sample_rate
+
+    def log(self, opener_prompt, text, response, **fields):
+        """
+        Sample a record and queue it without waiting for it to be written.
+
+        Args:
+            opener_prompt (str): The opener system prompt.
+            text (str): The user text the opener responded to.
+            response (str): The filtered opener.
+            **fields: Additional fields stored with the record.
+
+        Returns:
+            bool: Whether the record was queued, as opposed to sampled out
+                  or dropped.
+        """
+        if not self.sample():
+            return False
+        return self.write(opener_prompt, text, response, **fields)
+
+    def write(self, opener_prompt, text, response, **fields):
+        """
+        Queue an already sampled record, see `log` for the arguments.
+
+        Returns:
+            bool: Whether the record was queued, as opposed to dropped.
+        """
+        record = {"Opener_prompt": opener_prompt, "text": text,
+                  "response": response}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=10.0):
+        """
+        Write the queued records and stop the background thread.
+
+        Does not wait for a writer thread that has died, e.g. because the
+        log file could not be opened, and waits at most `timeout` seconds
+        for a live one.
+
+        Args:
+            timeout (float): Seconds to wait for the queue to be written.
+
+        Returns:
+            bool: Whether the background thread has stopped.
+        """
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            else:
+                self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _write_loop(self):
+        """Body of the background writer thread."""
+        output_f = open(self.path, "a", encoding="utf-8")
+        try:
+            size = output_f.tell()
+            while True:
+                record = self._queue.get()
+                stop = record is None
+                records = [] if stop else [record]
+                # Write whatever else is already waiting in one go.
+                while not stop:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        stop = True
+                    else:
+                        records.append(record)
+                if records:
+                    data = "".join(json.dumps(record) + "\n"
+                                   for record in records)
+                    output_f.write(data)
+                    output_f.flush()
+                    size += len(data.encode("utf-8"))
+                    self.written += len(records)
+                    if size >= self.max_bytes:
+                        output_f.close()
+                        os.replace(self.path, self.path + ".1")
+                        output_f = open(self.path, "a", encoding="utf-8")
+                        size = 0
+                        self.rotations += 1
+                if stop:
+                    break
+        finally:
+            output_f.close()
@@ -0,0 +1,291 @@
+"""Metrics for the stages of the GauchoChat opener pipeline.
+
+This module provides minimal counters and histograms, a registry that
+renders them in the Prometheus text exposition format, and the
+`OpenerMetrics` bundle recorded by the first turn module: stage durations,
+fallbacks by exception type, prompt token counts and response lengths.
+It has no dependencies, and nothing is recorded unless metrics are
+enabled in the first turn module.
+"""
+
+import bisect
+import math
+import threading
+
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 768, 1024, 1536, 2048, 4096)
+CHAR_BUCKETS = (16, 32, 64, 128, 256, 512, 1024)
+
+
+class Counter:
+    """
+    A monotonically increasing counter with optional labels.
+
+    Args:
+        name (str): The metric name.
+        help (str): The description shown in the exposition.
+        label_names (tuple): The names of the labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increase the counter of a label combination.
+
+        Args:
+            *label_values (str): One value per label name.
+            amount (float): The increment.
+        """
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0) + amount)
+
+    def snapshot(self):
+        """
+        Return the current values.
+
+        Returns:
+            dict: Mapping of label values tuple to count.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        """Yield (suffix, labels, value) exposition samples."""
+        for label_values, value in sorted(self.snapshot().items()):
+            yield "", dict(zip(self.label_names, label_values)), value
+
+
+class Histogram:
+    """
+    A histogram with fixed, cumulative buckets and optional labels.
+
+    Args:
+        name (str): The metric name.
+        help (str): The description shown in the exposition.
+        buckets (tuple): The sorted upper bounds of the buckets.
+        label_names (tuple): The names of the labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, label_names=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        Record one observation.
+
+        Args:
+            value (float): The observed value.
+            *label_values (str): One value per label name.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        """
+        Return the current values.
+
+        Returns:
+            dict: Mapping of label values tuple to a dict with the
+                  cumulative bucket counts, sum and count.
+        """
+        with self._lock:
+            values = {key: (list(state[0]), state[1], state[2])
+                      for key, state in self._values.items()}
+        snapshot = {}
+        for label_values, (counts, total, count) in values.items():
+            cumulative, running = [], 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,),
+                                           counts):
+                running += bucket_count
+                cumulative.append((bound, running))
+            snapshot[label_values] = {"buckets": cumulative, "sum": total,
+                                      "count": count}
+        return snapshot
+
+    def samples(self):
+        """Yield (suffix, labels, value) exposition samples."""
+        for label_values, state in sorted(self.snapshot().items()):
+            labels = dict(zip(self.label_names, label_values))
+            for bound, count in state["buckets"]:
+                yield "_bucket", dict(labels, le=_format_bound(bound)), count
+            yield "_sum", labels, state["sum"]
+            yield "_count", labels, state["count"]
+
+
+class MetricsRegistry:
+    """A collection of metrics that can be exported together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        Args:
+            metric (Counter or Histogram): The metric.
+
+        Returns:
+            The registered metric.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """
+        Return the values of every metric.
+
+        Returns:
+            dict: Mapping of metric name to its snapshot.
+        """
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} "
+                             f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class OpenerMetrics:
+    """
+    The metrics recorded for the opener pipeline.
+
+    Attributes:
+        registry (MetricsRegistry): Registry holding every metric below.
+        stage_seconds (Histogram): Duration of each pipeline stage.
+        fallbacks (Counter): Backup openers served, by reason and exception
+                             type.
+        paths (Counter): Opener requests by the path they took.
+        prompt_tokens (Histogram): Tokens in the prompts sent to the model.
+        response_chars (Histogram): Characters in the filtered responses.
+        generation_tokens (Counter): Tokens budgeted, generated and kept,
+                                     counted while the adaptive budget is
+                                     enabled.
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.stage_seconds = self.registry.register(Histogram(
+            "opener_stage_seconds", "Duration of opener pipeline stages.",
+            SECONDS_BUCKETS, ("stage",)))
+        self.fallbacks = self.registry.register(Counter(
+            "opener_fallbacks_total",
+            "Backup openers served instead of a model response.",
+            ("reason", "exception")))
+        self.paths = self.registry.register(Counter(
+            "opener_paths_total", "Opener requests by the path they took.",
+            ("path",)))
+        self.prompt_tokens = self.registry.register(Histogram(
+            "opener_prompt_tokens", "Tokens in opener prompts.",
+            TOKEN_BUCKETS))
+        self.response_chars = self.registry.register(Histogram(
+            "opener_response_chars", "Characters in filtered openers.",
+            CHAR_BUCKETS))
+        self.generation_tokens = self.registry.register(Counter(
+            "opener_generation_tokens_total",
+            "Opener tokens budgeted, generated and kept.", ("kind",)))
+
+    def observe_stage(self, stage, seconds):
+        """
+        Record the duration of a stage; usable as a stage observer.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): The duration of the stage.
+        """
+        self.stage_seconds.observe(seconds, stage)
+
+    def record_fallback(self, reason, exception=None):
+        """
+        Count a backup opener.
+
+        Args:
+            reason (str): Why the model did not deliver, e.g. "error".
+            exception (BaseException, optional): The error that occurred.
+        """
+        name = type(exception).__name__ if exception is not None else ""
+        self.fallbacks.inc(reason, name)
+
+    def record_response(self, prompt_tokens, response):
+        """
+        Record the size of a prompt and of the filtered response.
+
+        Args:
+            prompt_tokens (int): Tokens in the prompt.
+            response (str): The filtered response.
+        """
+        self.prompt_tokens.observe(prompt_tokens)
+        self.response_chars.observe(len(response))
+
+    def record_generation(self, budgeted, generated, kept):
+        """
+        Count the tokens of a generation.
+
+        Args:
+            budgeted (int): The max_new_tokens requested.
+            generated (int): Tokens the model generated.
+            kept (int): Tokens left after filtering.
+        """
+        self.generation_tokens.inc("budgeted", amount=budgeted)
+        self.generation_tokens.inc("generated", amount=generated)
+        self.generation_tokens.inc("kept", amount=kept)
+
+
+def _format_bound(bound):
+    """Format a bucket bound as a Prometheus `le` label value."""
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+def _format_value(value):
+    """Format a sample value."""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(labels):
+    """Format a label set, escaping the values."""
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels.items():
+        value = (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+                 .replace('"', '\\"'))
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
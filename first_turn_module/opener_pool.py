@@ -0,0 +1,231 @@
+"""Pool of pre-generated conversation openers for the first turn module.
+
+When a session starts with an empty history, the opener the model would
+produce does not depend on the user, only on the topical knowledge fed
+into the prompt. The `OpenerPool` keeps a bounded reservoir of such
+openers per topic, generated ahead of time by a background thread, so
+that the common first turn is served without waiting for the model.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class OpenerPool:
+    """
+    Per-topic reservoir of pre-generated, already filtered openers.
+
+    Openers older than `ttl` seconds are discarded instead of being served.
+    An opener is never pooled twice for a topic while it is still in the
+    reservoir or among the `dedup_window` openers most recently served.
+    A background thread tops every known topic back up to `max_size` as
+    soon as it falls below `low_watermark`.
+
+    Args:
+        generate_fn (callable): Called as `generate_fn(topic)` from the
+                                background thread; returns a filtered
+                                opener, or None if generation failed.
+        max_size (int): Maximum number of openers kept per topic.
+        low_watermark (int): Size below which a topic is refilled.
+        ttl (float): Seconds an opener stays fresh enough to be served.
+        dedup_window (int): Number of recently served openers per topic
+                            that may not be pooled again.
+        max_topics (int): Maximum number of topics kept; the least recently
+                          requested topic is dropped first.
+        refill_interval (float): Seconds between periodic refill sweeps,
+                                 which also replace expired openers.
+    """
+
+    def __init__(self, generate_fn, max_size=16, low_watermark=4, ttl=900.0,
+                 dedup_window=64, max_topics=32, refill_interval=5.0):
+        self.max_size = max_size
+        self.low_watermark = low_watermark
+        self.ttl = ttl
+        self.dedup_window = dedup_window
+        self.max_topics = max_topics
+        self.refill_interval = refill_interval
+        self._generate_fn = generate_fn
+        self._openers = OrderedDict()
+        self._served = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.duplicates = 0
+        self.generated = 0
+        self.generation_errors = 0
+
+    def start(self):
+        """Start the background refill thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._refill_loop, name="opener-pool-refill",
+                daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background refill thread."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def take(self, topic=None):
+        """
+        Take a fresh opener for a topic out of the pool.
+
+        Requesting a topic registers it for background refills, so the
+        first request for a new topic is a miss.
+
+        Args:
+            topic (str, optional): The topical knowledge of the session.
+
+        Returns:
+            str: A pooled opener, or None if none is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            reservoir = self._reservoir(topic)
+            opener = None
+            while reservoir:
+                candidate, created_at = reservoir.popleft()
+                if now - created_at <= self.ttl:
+                    opener = candidate
+                    break
+                self.expired += 1
+            if opener is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember_served(topic, opener)
+            needs_refill = len(reservoir) < self.low_watermark
+        if needs_refill:
+            self._wakeup.set()
+        return opener
+
+    def add(self, topic, opener):
+        """
+        Add an opener to a topic's reservoir unless it is a duplicate.
+
+        Args:
+            topic (str, optional): The topical knowledge the opener was
+                                   generated with.
+            opener (str): The filtered opener.
+
+        Returns:
+            bool: Whether the opener was added.
+        """
+        key = _normalize(opener)
+        if not key:
+            return False
+        with self._lock:
+            reservoir = self._reservoir(topic)
+            if (key in self._served.get(topic, ())
+                    or any(_normalize(text) == key for text, _ in reservoir)):
+                self.duplicates += 1
+                return False
+            if len(reservoir) >= self.max_size:
+                return False
+            reservoir.append((opener, time.monotonic()))
+            return True
+
+    def refill(self):
+        """Top up every known topic that is below its low watermark."""
+        now = time.monotonic()
+        with self._lock:
+            deficits = {}
+            for topic, reservoir in self._openers.items():
+                while reservoir and now - reservoir[0][1] > self.ttl:
+                    reservoir.popleft()
+                    self.expired += 1
+                if len(reservoir) < self.low_watermark:
+                    deficits[topic] = self.max_size - len(reservoir)
+
+        for topic, deficit in deficits.items():
+            # Allow some retries for duplicates, but never spin forever.
+            for _ in range(2 * deficit):
+                if self._stopped.is_set() or self.size(topic) >= self.max_size:
+                    break
+                try:
+                    opener = self._generate_fn(topic)
+                except Exception:
+                    opener = None
+                if not opener:
+                    self.generation_errors += 1
+                    break
+                self.generated += 1
+                self.add(topic, opener)
+
+    def size(self, topic=None):
+        """
+        Return the number of pooled openers for a topic.
+
+        Args:
+            topic (str, optional): The topical knowledge of the session.
+
+        Returns:
+            int: The number of openers currently pooled for the topic.
+        """
+        with self._lock:
+            return len(self._openers.get(topic, ()))
+
+    def stats(self):
+        """
+        Return the pool counters.
+
+        Returns:
+            dict: Hits, misses, expired and duplicate openers, generation
+                  counts, and the number of pooled openers.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "duplicates": self.duplicates,
+                "generated": self.generated,
+                "generation_errors": self.generation_errors,
+                "topics": len(self._openers),
+                "pooled": sum(len(r) for r in self._openers.values()),
+            }
+
+    def _reservoir(self, topic):
+        """Return the reservoir of a topic, registering it if needed."""
+        reservoir = self._openers.get(topic)
+        if reservoir is None:
+            reservoir = self._openers[topic] = deque()
+            while len(self._openers) > self.max_topics:
+                dropped, _ = self._openers.popitem(last=False)
+                self._served.pop(dropped, None)
+        else:
+            self._openers.move_to_end(topic)
+        return reservoir
+
+    def _remember_served(self, topic, opener):
+        """Record a served opener in the topic's dedup window."""
+        served = self._served.setdefault(topic, OrderedDict())
+        served[_normalize(opener)] = None
+        while len(served) > self.dedup_window:
+            served.popitem(last=False)
+
+    def _refill_loop(self):
+        """Body of the background refill thread."""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.refill()
+
+
+def _normalize(opener):
+    """Normalize an opener for duplicate detection."""
+    return re.sub(r"\W+", " ", opener).strip().lower()
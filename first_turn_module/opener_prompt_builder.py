@@ -0,0 +1,155 @@
+"""Incremental opener prompt building for the GauchoChat first turn module.
+
+Re-creating the opener conversation from the full history on every call
+makes its cost grow with the length of the session. The
+`IncrementalPromptBuilder` keeps one conversation per session instead: it
+appends only the turns added since the last call, keeps their rendered
+text, and drops the oldest turns once the history exceeds a token budget.
+The rendering is the same as `SeparatorStyle.SINGLE`.
+"""
+
+import copy
+import threading
+from collections import deque
+
+from .opener_tokenizer import approx_token_count
+
+
+class IncrementalPromptBuilder:
+    """
+    Incrementally maintained conversation and rendered turns of a session.
+
+    A turn is considered settled once the bot has answered it; settled
+    turns are rendered once and kept. The turns after the last settled one
+    are re-rendered on every call, since the bot answer may still arrive.
+    The settled turns of every history are compared with the ones kept; if
+    any of them changed or disappeared, the builder starts over from the
+    history.
+
+    Args:
+        conv (Conversation): An empty conversation to build on. It is
+                             updated in place by `update`, which hands out
+                             snapshots of it.
+        token_budget (int, optional): Maximum number of tokens for the
+                                      rendered turns. The oldest settled
+                                      turns are dropped to stay within it.
+        count_tokens (callable): Function returning the number of tokens
+                                 in a text.
+    """
+
+    def __init__(self, conv, token_budget=None,
+                 count_tokens=approx_token_count):
+        self.conv = conv
+        self.token_budget = token_budget
+        self._count_tokens = count_tokens
+        self._lock = threading.Lock()
+        self._reset()
+
+    def update(self, history):
+        """
+        Bring the conversation and rendered turns up to date with a history.
+
+        Args:
+            history (list): A list of dictionaries containing the history of
+                            the conversation.
+
+        Returns:
+            tuple: A snapshot of the updated Conversation object, which the
+                   caller may modify, and the rendered turns, without the
+                   system prefix.
+        """
+        with self._lock:
+            settled = self._settled_turns
+            if (len(history) < settled
+                    or any(_turn_key(turn) != key for turn, key
+                           in zip(history, self._settled_keys))):
+                self._reset()
+                settled = 0
+
+            index = settled
+            while index < len(history) and history[index].get("bot"):
+                self._settle(history[index])
+                index += 1
+            self._truncate()
+
+            # Re-render the turns still waiting for a bot answer.
+            messages = self.conv.messages
+            del messages[self._settled_messages:]
+            tail = []
+            for turn in history[index:]:
+                for role, message in _turn_messages(self.conv.roles, turn):
+                    messages.append([role, message])
+                    tail.append(_render(role, message, self.conv.sep))
+            # Calls for the same session may overlap, e.g. hedged requests,
+            # so each gets a conversation of its own.
+            conv = copy.copy(self.conv)
+            conv.messages = list(messages)
+            return conv, self._rendered + "".join(tail)
+
+    def _reset(self):
+        """Forget every turn seen so far."""
+        # A list of our own, whatever sequence the conversation came with
+        self.conv.messages = []
+        self._segments = deque()
+        self._rendered = ""
+        self._tokens = 0
+        self._settled_turns = 0
+        self._settled_messages = 0
+        self._settled_keys = []
+
+    def _settle(self, turn):
+        """Render a settled turn and append it to the kept turns."""
+        messages = self.conv.messages
+        del messages[self._settled_messages:]
+        text = ""
+        turn_messages = _turn_messages(self.conv.roles, turn)
+        for role, message in turn_messages:
+            messages.append([role, message])
+            text += _render(role, message, self.conv.sep)
+        tokens = (self._count_tokens(text)
+                  if self.token_budget is not None else 0)
+        self._segments.append((text, tokens, len(turn_messages)))
+        self._rendered += text
+        self._tokens += tokens
+        self._settled_turns += 1
+        self._settled_messages = len(messages)
+        self._settled_keys.append(_turn_key(turn))
+
+    def _truncate(self):
+        """Drop the oldest settled turns until within the token budget."""
+        if self.token_budget is None:
+            return
+        dropped_chars = dropped_messages = 0
+        while len(self._segments) > 1 and self._tokens > self.token_budget:
+            text, tokens, message_count = self._segments.popleft()
+            self._tokens -= tokens
+            dropped_chars += len(text)
+            dropped_messages += message_count
+        if dropped_chars:
+            self._rendered = self._rendered[dropped_chars:]
+            del self.conv.messages[:dropped_messages]
+            self._settled_messages -= dropped_messages
+
+
+def _turn_key(turn):
+    """Return the parts of a turn that affect the prompt."""
+    return turn.get("user"), turn.get("bot")
+
+
+def _turn_messages(roles, turn):
+    """Return the messages a history turn adds to the conversation."""
+    messages = []
+    if turn.get("user"):
+        messages.append((roles[0], turn["user"]))
+    if turn.get("bot"):
+        messages.append((roles[1], turn["bot"]))
+    else:
+        messages.append((roles[1], None))
+    return messages
+
+
+def _render(role, message, sep):
+    """Render one message the way `SeparatorStyle.SINGLE` does."""
+    if message:
+        return role + ": " + message + sep
+    return role + ":"
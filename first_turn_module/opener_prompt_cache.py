@@ -0,0 +1,142 @@
+"""Cache of rendered opener prompt prefixes for the first turn module.
+
+The opener prompt starts with the system prompt, optionally extended with
+the user's topical knowledge. That static prefix is identical for every
+session sharing the same knowledge, so it is rendered once and kept in a
+size-limited LRU cache; only the per-user conversation turns are rendered
+on each call. The cache is keyed on short digests of the system prompt and
+the knowledge, computed once per loaded string, rather than on the texts.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+
+PrefixEntry = namedtuple("PrefixEntry", ["system", "text"])
+PrefixEntry.__doc__ = """
+A rendered prompt prefix.
+
+Attributes:
+    system (str): The system message the prefix was rendered from.
+    text (str): The rendered prefix, ready to be followed by the turns.
+"""
+
+
+class PromptPrefixCache:
+    """
+    Thread-safe LRU cache of rendered prompt prefixes.
+
+    Entries are evicted, least recently used first, once the cache holds
+    more than `max_entries` prefixes or more than `max_chars` characters.
+
+    Args:
+        max_entries (int): Maximum number of cached prefixes.
+        max_chars (int): Maximum total length of the cached prefixes.
+    """
+
+    def __init__(self, max_entries=256, max_chars=4_000_000):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        # id(text) -> (text, digest) of recently keyed texts
+        self._digests = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def text_key(self, text):
+        """
+        Return a short key for a possibly long text, e.g. the knowledge.
+
+        The digest is remembered by the identity of the string, so a text
+        that is loaded once and passed on every call is hashed only once,
+        and lookups neither hash nor compare the full text again.
+
+        Args:
+            text (str, optional): The text to key.
+
+        Returns:
+            bytes: A 16-byte digest of the text, or None for None.
+        """
+        if text is None:
+            return None
+        with self._lock:
+            known = self._digests.get(id(text))
+            if known is not None and known[0] is text:
+                self._digests.move_to_end(id(text))
+                return known[1]
+
+        digest = hashlib.sha256(text.encode()).digest()[:16]
+        with self._lock:
+            # Keeping the text alive keeps its id from being reused
+            self._digests[id(text)] = (text, digest)
+            while len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
+        return digest
+
+    def get(self, key, render):
+        """
+        Return the cached prefix for `key`, rendering it on a miss.
+
+        Args:
+            key (tuple): Hashable description of everything the prefix
+                         depends on, with long texts keyed by `text_key`.
+            render (callable): Called without arguments on a miss; returns
+                               the system message and the rendered prefix.
+
+        Returns:
+            PrefixEntry: The cached or freshly rendered prefix.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = PrefixEntry(*render())
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._chars += len(entry.text)
+                self._evict()
+        return entry
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, current size and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "chars": self._chars,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """Drop every cached prefix and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._chars = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def _evict(self):
+        """Evict least recently used entries until within the limits."""
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._chars > self.max_chars):
+            _, entry = self._entries.popitem(last=False)
+            self._chars -= len(entry.text)
+            self.evictions += 1
@@ -0,0 +1,194 @@
+"""Persistent cache of model responses for the first turn module.
+
+Evaluation reruns send mostly the same prompts to the model again. With
+the cache enabled, every model output is stored on disk under a hash of
+everything the generation depends on (the rendered prompt, stop token,
+model name, token limit and sampling settings), so an unchanged request
+is answered from disk, also by later processes. The cache directory is
+bounded in size by evicting the least recently used responses.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class CachedResponse(str):
+    """A response answered from the cache rather than generated."""
+
+
+class ResponseCache:
+    """
+    Thread-safe, size-bounded, content-addressed cache of responses on disk.
+
+    Every response is stored in its own file named by its key, so several
+    processes can share a directory; each process enforces the size limit
+    over the files it knows of.
+
+    Args:
+        directory (str): Directory holding the cached responses.
+        max_bytes (int): Maximum total size of the cached responses.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(**request):
+        """
+        Return the key of a request.
+
+        Args:
+            **request: Everything the response depends on, e.g. the prompt,
+                       model name, max_new_tokens and temperature.
+
+        Returns:
+            str: Hex digest of the request.
+        """
+        encoded = json.dumps(request, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached response for `key`.
+
+        Args:
+            key (str): The request key, see `make_key`.
+
+        Returns:
+            CachedResponse: The response, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as response_file:
+                response = response_file.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._bytes -= size
+            return None
+        try:
+            # Mark the entry as recently used for other processes too
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key not in self._entries:
+                self._add(key, os.path.getsize(path))
+            self._entries.move_to_end(key)
+        return CachedResponse(response)
+
+    def put(self, key, response):
+        """
+        Store the response for `key`.
+
+        Args:
+            key (str): The request key, see `make_key`.
+            response (str): The model output.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = response.encode("utf-8")
+        # Write to a temporary file first so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as response_file:
+            response_file.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._bytes -= size
+            self._add(key, len(data))
+            evicted = self._evict()
+        self._delete(evicted)
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, current size and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """Delete every cached response and reset the counters."""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+        self._delete(keys)
+
+    def _path(self, key):
+        """Return the file of a key, fanned out over subdirectories."""
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def _load(self):
+        """Index the responses already on disk, least recently used first."""
+        found = []
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if entry.name.startswith("tmp"):
+                    continue
+                stat = entry.stat()
+                found.append((stat.st_mtime, subdirectory.name + entry.name,
+                              stat.st_size))
+        for _, key, size in sorted(found):
+            self._add(key, size)
+        self._delete(self._evict())
+
+    def _delete(self, keys):
+        """Delete the files of the given keys, if they still exist."""
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _add(self, key, size):
+        """Index an entry as the most recently used one."""
+        self._entries[key] = size
+        self._bytes += size
+
+    def _evict(self):
+        """
+        Drop least recently used entries until within the size limit.
+
+        Returns:
+            list: The keys of the dropped entries, whose files still have
+                  to be deleted.
+        """
+        evicted = []
+        while self._entries and self._bytes > self.max_bytes:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
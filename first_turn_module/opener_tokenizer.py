@@ -0,0 +1,90 @@
+"""Token counting for the GauchoChat first turn module.
+
+Prompt budgets in this module are expressed in model tokens. When a
+tokenizer path is configured and `transformers` is installed, the model's
+own tokenizer is loaded once and reused; otherwise tokens are estimated
+from words and punctuation. Counts are cached, since the same knowledge
+snippets and turns are measured again on every call.
+"""
+
+import functools
+import re
+
+
+_tokenizer_path = None
+
+
+def set_tokenizer_path(path):
+    """
+    Select the tokenizer used for counting tokens.
+
+    Args:
+        path (str, optional): A name or path accepted by
+                              `transformers.AutoTokenizer.from_pretrained`,
+                              or None to estimate token counts.
+    """
+    global _tokenizer_path
+    _tokenizer_path = path
+    count_tokens.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(path):
+    """
+    Load a tokenizer once per path.
+
+    Args:
+        path (str): A name or path of a pretrained tokenizer.
+
+    Returns:
+        PreTrainedTokenizer: The tokenizer, or None if `transformers` is not
+                             installed.
+    """
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        return None
+    return AutoTokenizer.from_pretrained(path, use_fast=True)
+
+
+def approx_token_count(text):
+    """
+    Estimate the number of tokens in a text.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The number of words and punctuation marks in the text.
+    """
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+@functools.lru_cache(maxsize=16384)
+def count_tokens(text):
+    """
+    Count the tokens of a text that is likely to be measured again.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The number of tokens in the text.
+    """
+    return measure_tokens(text)
+
+
+def measure_tokens(text):
+    """
+    Count the tokens of a text with the configured tokenizer, uncached.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The number of tokens in the text.
+    """
+    tokenizer = get_tokenizer(_tokenizer_path) if _tokenizer_path else None
+    if tokenizer is None:
+        return approx_token_count(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
@@ -0,0 +1,432 @@
+"""HTTP client for the Vicuna controller and model workers.
+
+The client speaks the FastChat controller and worker API directly, which
+gives the first turn module access to the token stream of a generation
+instead of only its final text. It is meant to be long-lived: it keeps a
+pooled keep-alive session per worker, caches the workers the controller
+resolves for each model, refreshes that cache in the background, and
+spreads requests over the workers by their number of outstanding
+requests. Neither the controller lookup nor connection setup is then on
+the latency path of a request.
+
+`agenerate` is the asyncio counterpart of `generate`. It needs `aiohttp`,
+which is imported on first use, and keeps one session per event loop, so
+concurrent generations wait on the event loop instead of on threads.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import weakref
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class GenerationOutput(str):
+    """
+    The output of a generation, with what the worker reported about it.
+
+    Attributes:
+        finish_reason (str): Why the generation ended, "stop" or "length",
+                             or None if the worker did not report it.
+        completion_tokens (int): Model tokens generated, or None if the
+                                 worker did not report them.
+    """
+
+    finish_reason = None
+    completion_tokens = None
+
+
+class VicunaClient:
+    """
+    Client for a FastChat controller and the workers it manages.
+
+    The FastChat controller only hands out one worker per lookup, so the
+    worker list of a model is built by asking it `probes` times and then
+    dropping the workers that do not answer a status request.
+
+    Args:
+        controller_address (str): The address of the controller.
+        timeout (float): Seconds to wait for the server to respond.
+        worker_ttl (float): Seconds a cached worker list stays valid. Lists
+                            are refreshed in the background before expiring.
+        probes (int): Number of controller lookups per worker list refresh.
+        pool_maxsize (int): Maximum number of keep-alive connections kept
+                            per worker.
+    """
+
+    def __init__(self, controller_address, timeout=30.0, worker_ttl=30.0,
+                 probes=4, pool_maxsize=32):
+        self.controller_address = controller_address
+        self.timeout = timeout
+        self.worker_ttl = worker_ttl
+        self.probes = probes
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._workers = {}
+        self._outstanding = Counter()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._refresher = None
+        self._refreshing = set()
+
+    def get_worker_address(self, model_name):
+        """
+        Ask the controller for a worker serving the model.
+
+        Args:
+            model_name (str): The name of the model.
+
+        Returns:
+            str: The address of the worker.
+
+        Raises:
+            RuntimeError: If no worker serves the model.
+        """
+        response = self._session(self.controller_address).post(
+            self.controller_address + "/get_worker_address",
+            json={"model": model_name}, timeout=self.timeout)
+        response.raise_for_status()
+        worker_address = response.json()["address"]
+        if not worker_address:
+            raise RuntimeError(f"No worker available for {model_name}")
+        return worker_address
+
+    def list_workers(self, model_name):
+        """
+        Return the cached workers serving the model.
+
+        Only the first call for a model waits for the controller; later
+        calls return the cached list while it is refreshed in the
+        background. A list older than `worker_ttl`, e.g. while the
+        controller is down, is still returned, and a refresh is started
+        without waiting for it.
+
+        Args:
+            model_name (str): The name of the model.
+
+        Returns:
+            list: The addresses of the workers.
+        """
+        with self._lock:
+            cached = self._workers.get(model_name)
+        if cached is None:
+            # Let concurrent first requests share a single lookup.
+            with self._refresh_lock:
+                with self._lock:
+                    cached = self._workers.get(model_name)
+                if cached is None:
+                    return self.refresh_workers(model_name)
+        if time.monotonic() - cached[1] > self.worker_ttl:
+            # The refresher is late or failing; keep the controller off
+            # the request path.
+            self._refresh_in_background(model_name)
+        return cached[0]
+
+    def refresh_workers(self, model_name):
+        """
+        Re-resolve the workers of a model through the controller.
+
+        Args:
+            model_name (str): The name of the model.
+
+        Returns:
+            list: The addresses of the responsive workers.
+
+        Raises:
+            RuntimeError: If no worker serves the model.
+        """
+        addresses = set()
+        for _ in range(self.probes):
+            addresses.add(self.get_worker_address(model_name))
+        workers = sorted(address for address in addresses
+                         if self._is_alive(address))
+        if not workers:
+            raise RuntimeError(f"No worker available for {model_name}")
+        with self._lock:
+            self._workers[model_name] = (workers, time.monotonic())
+        self._start_refresher()
+        return workers
+
+    def generate_stream(self, prompt, stop_token, worker_address, model_name,
+                        max_new_tokens, temperature=0.7, timeout=None):
+        """
+        Stream a generation from a model worker.
+
+        Closing the generator closes the connection, which makes the worker
+        stop generating.
+
+        Args:
+            prompt (str): The prompt to send to the model.
+            stop_token (str or tuple): The stop token(s) for the generation.
+            worker_address (str, optional): The address of the worker. If
+                                            None, the least busy cached
+                                            worker is used.
+            model_name (str): The name of the model to be used.
+            max_new_tokens (int): The maximum number of new tokens.
+            temperature (float): The sampling temperature.
+            timeout (float, optional): Seconds the whole generation may
+                                       take, in addition to the per-read
+                                       timeout of the client.
+
+        Yields:
+            GenerationOutput: The output generated so far, including the
+                              echoed prompt.
+
+        Raises:
+            RuntimeError: If the worker reports an error.
+            TimeoutError: If the generation took longer than `timeout`.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        worker_address = self._acquire_worker(worker_address, model_name)
+        params = {
+            "model": model_name,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_new_tokens": max_new_tokens,
+            "stop": stop_token,
+        }
+        read_timeout = self.timeout if timeout is None \
+            else min(self.timeout, timeout)
+        try:
+            response = self._session(worker_address).post(
+                worker_address + "/worker_generate_stream", json=params,
+                stream=True, timeout=read_timeout)
+            try:
+                response.raise_for_status()
+                for chunk in response.iter_lines(decode_unicode=False,
+                                                 delimiter=b"\0"):
+                    if deadline is not None and time.monotonic() > deadline:
+                        # Closing the response stops the worker.
+                        raise TimeoutError(
+                            f"generation exceeded {timeout:.3f}s")
+                    if chunk:
+                        yield self._parse_chunk(chunk, "")
+            finally:
+                response.close()
+        finally:
+            self._release_worker(worker_address)
+
+    def generate(self, prompt, stop_token, worker_address, model_name,
+                 max_new_tokens, temperature=0.7, timeout=None):
+        """
+        Run a generation to completion.
+
+        Args:
+            prompt (str): The prompt to send to the model.
+            stop_token (str or tuple): The stop token(s) for the generation.
+            worker_address (str, optional): The address of the worker. If
+                                            None, the least busy cached
+                                            worker is used.
+            model_name (str): The name of the model to be used.
+            max_new_tokens (int): The maximum number of new tokens.
+            temperature (float): The sampling temperature.
+            timeout (float, optional): Seconds the whole generation may
+                                       take.
+
+        Returns:
+            GenerationOutput: The final output, including the echoed prompt.
+        """
+        output = ""
+        for output in self.generate_stream(prompt, stop_token, worker_address,
+                                           model_name, max_new_tokens,
+                                           temperature, timeout):
+            pass
+        return output
+
+    async def agenerate(self, prompt, stop_token, worker_address, model_name,
+                        max_new_tokens, temperature=0.7):
+        """
+        Run a generation to completion without blocking the event loop.
+
+        Args:
+            prompt (str): The prompt to send to the model.
+            stop_token (str or tuple): The stop token(s) for the generation.
+            worker_address (str, optional): The address of the worker. If
+                                            None, the least busy cached
+                                            worker is used.
+            model_name (str): The name of the model to be used.
+            max_new_tokens (int): The maximum number of new tokens.
+            temperature (float): The sampling temperature.
+
+        Returns:
+            GenerationOutput: The final output, including the echoed prompt.
+
+        Raises:
+            RuntimeError: If the worker reports an error.
+        """
+        if worker_address is None and not self._has_workers(model_name):
+            # Only the first lookup of a model waits for the controller;
+            # do that on a thread rather than on the event loop.
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.list_workers, model_name)
+        worker_address = self._acquire_worker(worker_address, model_name)
+        params = {
+            "model": model_name,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_new_tokens": max_new_tokens,
+            "stop": stop_token,
+        }
+        output = ""
+        buffer = b""
+        try:
+            async with self._async_session().post(
+                    worker_address + "/worker_generate_stream",
+                    json=params) as response:
+                response.raise_for_status()
+                async for data in response.content.iter_any():
+                    *chunks, buffer = (buffer + data).split(b"\0")
+                    for chunk in chunks:
+                        output = self._parse_chunk(chunk, output)
+                output = self._parse_chunk(buffer, output)
+        finally:
+            self._release_worker(worker_address)
+        return output
+
+    async def aclose(self):
+        """Close the asyncio session of the running event loop, if any."""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def outstanding(self):
+        """
+        Return the number of in-flight requests per worker.
+
+        Returns:
+            dict: Mapping of worker address to outstanding requests.
+        """
+        with self._lock:
+            return {address: count
+                    for address, count in self._outstanding.items() if count}
+
+    def close(self):
+        """Stop the background refresh and close every pooled connection."""
+        self._closed.set()
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def _session(self, address):
+        """Return the keep-alive session for an address."""
+        session = self._sessions.get(address)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(address)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1,
+                                          pool_maxsize=self.pool_maxsize)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[address] = session
+        return session
+
+    def _async_session(self):
+        """Return the aiohttp session of the running event loop."""
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None:
+            import aiohttp
+            # No connection limit: the workers bound their own concurrency.
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.timeout, sock_read=self.timeout))
+            self._async_sessions[loop] = session
+        return session
+
+    @staticmethod
+    def _parse_chunk(chunk, output):
+        """Return the output of a streamed chunk, or `output` if empty."""
+        if not chunk:
+            return output
+        data = json.loads(chunk.decode())
+        if data.get("error_code", 0) != 0:
+            raise RuntimeError(data.get("text", "Model worker error"))
+        output = GenerationOutput(data["text"])
+        output.finish_reason = data.get("finish_reason")
+        output.completion_tokens = (data.get("usage") or {}).get(
+            "completion_tokens")
+        return output
+
+    def _has_workers(self, model_name):
+        """Check whether a worker list of the model is cached."""
+        with self._lock:
+            return model_name in self._workers
+
+    def _is_alive(self, worker_address):
+        """Check whether a worker answers a status request."""
+        try:
+            response = self._session(worker_address).post(
+                worker_address + "/worker_get_status", timeout=self.timeout)
+            response.raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    def _acquire_worker(self, worker_address, model_name):
+        """Pick the least busy worker and count the request against it."""
+        if worker_address is None:
+            workers = self.list_workers(model_name)
+        else:
+            workers = [worker_address]
+        with self._lock:
+            worker_address = min(workers,
+                                 key=lambda address: self._outstanding[address])
+            self._outstanding[worker_address] += 1
+        return worker_address
+
+    def _release_worker(self, worker_address):
+        """Count a finished request against a worker."""
+        with self._lock:
+            self._outstanding[worker_address] -= 1
+
+    def _start_refresher(self):
+        """Start the background worker list refresh if not running."""
+        with self._lock:
+            if self._refresher is not None or self._closed.is_set():
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="vicuna-worker-refresh",
+                daemon=True)
+        self._refresher.start()
+
+    def _refresh_in_background(self, model_name):
+        """Refresh the workers of a model on a thread, unless one is."""
+        with self._lock:
+            if model_name in self._refreshing or self._closed.is_set():
+                return
+            self._refreshing.add(model_name)
+
+        def refresh():
+            try:
+                self.refresh_workers(model_name)
+            except (requests.RequestException, RuntimeError):
+                # Keep serving from the last known workers.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(model_name)
+
+        threading.Thread(target=refresh, name="vicuna-worker-lookup",
+                         daemon=True).start()
+
+    def _refresh_loop(self):
+        """Body of the background worker list refresh."""
+        while not self._closed.wait(self.worker_ttl / 2):
+            with self._lock:
+                model_names = list(self._workers)
+            for model_name in model_names:
+                try:
+                    self.refresh_workers(model_name)
+                except (requests.RequestException, RuntimeError):
+                    # Keep serving from the last known workers.
+                    pass
@@ -0,0 +1,131 @@
+"""Prompt equivalence of the incremental builder and the full rebuild."""
+
+import random
+
+import pytest
+
+pytest.importorskip("fastchat.conversation")
+
+from first_turn_module.first_turn import (_create_opener_conversation,
+                                          _get_prompt, _get_prompt_builder)
+from first_turn_module.opener_prompt_builder import IncrementalPromptBuilder
+from first_turn_module.opener_tokenizer import approx_token_count
+
+SYSTEM = "You are a friendly chatbot."
+WORDS = ["hi", "there", "how", "are", "you", "doing", "today", "?", "!"]
+
+
+def rebuilt_prompt(history, continued_generation=False):
+    """Render the history from scratch with `SeparatorStyle.SINGLE`."""
+    conv = _create_opener_conversation(history, SYSTEM)
+    return _get_prompt(conv, continued_generation)
+
+
+def incremental_prompt(builder, history, continued_generation=False):
+    """Render the history with the builder, as `_prepare_opener_prompt` does."""
+    conv, turns = builder.update(history)
+    return _get_prompt(conv, continued_generation, conv.system + conv.sep,
+                       turns)
+
+
+def new_builder(token_budget=None):
+    return IncrementalPromptBuilder(_create_opener_conversation([], SYSTEM),
+                                    token_budget=token_budget)
+
+
+def random_text(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+
+
+def random_turn(rng, answered=True):
+    return {"user": random_text(rng) if rng.random() < 0.9 else "",
+            "bot": random_text(rng) if answered else None}
+
+
+def test_growing_history_matches_rebuild():
+    rng = random.Random(0)
+    builder = new_builder()
+    history = []
+    for _ in range(50):
+        history = [dict(turn) for turn in history]
+        if history and history[-1]["bot"] is None:
+            history[-1]["bot"] = random_text(rng)
+        else:
+            history.append(random_turn(rng, answered=rng.random() < 0.5))
+        for continued_generation in (False, True):
+            assert (incremental_prompt(builder, history, continued_generation)
+                    == rebuilt_prompt(history, continued_generation))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_edited_history_matches_rebuild(seed):
+    rng = random.Random(seed)
+    builder = new_builder()
+    history = [random_turn(rng) for _ in range(5)]
+    for _ in range(60):
+        history = [dict(turn) for turn in history]
+        action = rng.random()
+        if action < 0.3 and history:
+            # Edit any turn, including settled ones before the last
+            turn = rng.choice(history)
+            turn[rng.choice(["user", "bot"])] = random_text(rng)
+        elif action < 0.45 and history:
+            del history[rng.randrange(len(history))]
+        elif action < 0.55 and history:
+            history[rng.randrange(len(history))]["bot"] = None
+        else:
+            history.append(random_turn(rng, answered=rng.random() < 0.7))
+        assert incremental_prompt(builder, history) == rebuilt_prompt(history)
+
+
+def test_token_budget_keeps_newest_turns():
+    rng = random.Random(1)
+    budget = 40
+    builder = new_builder(token_budget=budget)
+    history = []
+    for _ in range(30):
+        history = history + [random_turn(rng)]
+        prompt = incremental_prompt(builder, history)
+        # The prompt is the rebuild of the newest turns that fit the budget,
+        # keeping at least the last settled turn
+        for start in range(len(history)):
+            kept = history[start:]
+            turns = rebuilt_prompt(kept)[len(SYSTEM + "</s>"):]
+            if (approx_token_count(turns) <= budget
+                    or start == len(history) - 1):
+                break
+        assert prompt == rebuilt_prompt(kept)
+
+
+def test_update_returns_independent_snapshots():
+    builder = new_builder()
+    history = [{"user": "hi", "bot": "hello"}, {"user": "how are you",
+                                                "bot": None}]
+    first, _ = builder.update(history)
+    first.system += " Knowledge."
+    second, turns = builder.update(history + [{"user": "still there?",
+                                               "bot": None}])
+    assert second.system == SYSTEM
+    assert first.messages != second.messages
+    assert _get_prompt(second, False, second.system + second.sep, turns) \
+        == rebuilt_prompt(history + [{"user": "still there?", "bot": None}])
+
+
+def test_builder_owns_its_messages():
+    conv = _create_opener_conversation([], SYSTEM)
+    conv.messages = ()
+    builder = IncrementalPromptBuilder(conv)
+    history = [{"user": "hi", "bot": "hello"}, {"user": "bye", "bot": None}]
+    assert incremental_prompt(builder, history) == rebuilt_prompt(history)
+
+
+def test_sessions_get_a_builder():
+    class Session:
+        pass
+
+    session = Session()
+    builder = _get_prompt_builder(session)
+    assert isinstance(builder, IncrementalPromptBuilder)
+    assert _get_prompt_builder(session) is builder
+    # Sessions that cannot be weakly referenced rebuild the prompt instead
+    assert _get_prompt_builder(object()) is None